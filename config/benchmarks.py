@@ -0,0 +1,209 @@
+"""
+Бенчмарк горячих путей API: перцентили задержки, число SQL-запросов и пик выделенной памяти
+для каждого сценария. Запускается командой run_benchmarks против уже заполненной базы;
+объём данных (1k / 100k / 1M строк) задаётся заполнением базы, а число строк
+записывается в результат, чтобы прогоны можно было сравнивать между собой.
+"""
+import statistics
+import time
+import tracemalloc
+from contextlib import contextmanager
+from decimal import Decimal
+from itertools import count
+from unittest import mock
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.redis import RedisCache
+from django.db import close_old_connections, connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from lms.models import Course, Lesson, Subscription
+from lms.roles import sees_all
+from lms.tasks import chunked
+from users.models import CustomUser, Payment
+from users.serializers import MyTokenObtainPairSerializer
+
+# Бюджеты по сценариям: p95 задержки (мс), число запросов и пик памяти (КБ) на один запрос.
+# Число запросов не должно зависеть от объёма данных — это и ловит N+1.
+BUDGETS = {
+    'course_list': {'p95_ms': 150, 'queries': 8, 'memory_kb': 2048},
+    'course_detail': {'p95_ms': 100, 'queries': 7, 'memory_kb': 1024},
+    'lesson_list': {'p95_ms': 150, 'queries': 6, 'memory_kb': 2048},
+    'subscription_toggle': {'p95_ms': 50, 'queries': 2, 'memory_kb': 512},
+    'payment_list': {'p95_ms': 200, 'queries': 4, 'memory_kb': 4096},
+    'payment_filter': {'p95_ms': 200, 'queries': 4, 'memory_kb': 4096},
+    'checkout': {'p95_ms': 150, 'queries': 6, 'memory_kb': 1024},
+}
+
+
+# Сценарии без записи: их можно гонять вне транзакции-обёртки
+READ_ONLY = {'course_list', 'course_detail', 'lesson_list', 'payment_list', 'payment_filter'}
+
+
+class BenchmarkError(Exception):
+    pass
+
+
+class StubGateway:
+    """StripeGateway без сети: цена и сессия создаются мгновенно."""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def create_product_and_price(self, *, name, amount, currency='usd'):
+        return f'price_bench_{amount}_{currency}'
+
+    def start_checkout(self, *, price_id, success_url, cancel_url):
+        return f'cs_bench_{time.perf_counter_ns()}', f'https://checkout.stripe.test/{price_id}'
+
+
+def auth_client(user) -> APIClient:
+    """Клиент с настоящим JWT, чтобы в замер попадала и аутентификация."""
+    client = APIClient()
+    token = MyTokenObtainPairSerializer.get_token(user).access_token
+    client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+    return client
+
+
+def scenarios(user) -> dict:
+    """{имя: функция(client) -> response} для пользователя, от имени которого идут запросы."""
+    courses = Course.objects.all() if sees_all(user) else Course.objects.filter(owner_id=user.id)
+    course = courses.order_by('id').first()
+    if course is None:
+        raise BenchmarkError(f'{user.email} не видит ни одного курса: заполните базу или укажите другой --email.')
+    paid_course_id = Payment.objects.exclude(course=None).values_list('course_id', flat=True).first() or course.id
+    return {
+        'course_list': lambda c: c.get(reverse('course-list')),
+        'course_detail': lambda c: c.get(reverse('course-detail', args=[course.id])),
+        'lesson_list': lambda c: c.get(reverse('lesson-list')),
+        'subscription_toggle': lambda c: c.post(
+            reverse('subscription-toggle'), {'course_id': course.id}, format='json'
+        ),
+        'payment_list': lambda c: c.get(reverse('payment-list')),
+        'payment_filter': lambda c: c.get(reverse('payment-list'), {'course': paid_course_id}),
+        'checkout': lambda c: c.post(
+            reverse('payment-checkout') + '?async=false',
+            {'course': course.id, 'amount': str(Decimal('990.00'))}, format='json',
+        ),
+    }
+
+
+def percentile(values, p) -> float:
+    if len(values) < 2:
+        return values[0]
+    return statistics.quantiles(values, n=100, method='inclusive')[p - 1]
+
+
+@contextmanager
+def isolated_cache():
+    """
+    Сценарии работают с кешем под собственным префиксом ключей, который удаляется по окончании:
+    бенчмарк не видит рабочих ключей и не оставляет своих (например, price_id заглушки
+    под stripe_price:*, который иначе ушёл бы в настоящий checkout).
+    """
+    prefix = f'bench-{uuid4().hex}'
+    config = {**settings.CACHES['default'], 'KEY_PREFIX': prefix}
+    with override_settings(CACHES={**settings.CACHES, 'default': config}):
+        try:
+            yield prefix
+        finally:
+            purge(prefix)
+
+
+def purge(prefix: str):
+    """Удалить ключи прогона из Redis; в прочих бэкендах они недостижимы и истекают по TTL."""
+    backend = caches['default']
+    if isinstance(backend, RedisCache):
+        client = backend._cache.get_client(write=True)
+        for keys in chunked(client.scan_iter(match=f'{prefix}*', count=1000), 1000):
+            client.delete(*keys)
+
+
+def measure(request, client, *, iterations: int, warmup: int, cold_cache: bool, recycle_connections: bool) -> dict:
+    """
+    Сначала warmup-запросы, затем iterations замеров задержки без лишних обёрток.
+    Запросы и память считаются отдельным проходом: tracemalloc заметно замедляет код.
+    cold_cache: перед каждым запросом префикс ключей меняется, так что запрос видит пустой кеш
+    (общий кеш при этом не очищается).
+    recycle_connections: после каждого запроса устаревшие соединения закрываются так же,
+    как в обработчике WSGI (тестовый клиент сам этого не делает), поэтому в задержку
+    попадает стоимость подключения согласно CONN_MAX_AGE.
+    """
+    base, runs = cache.key_prefix, count()
+
+    def call():
+        if cold_cache:
+            cache.key_prefix = f'{base}-{next(runs)}'
+        try:
+            response = request(client)
+        finally:
+            if recycle_connections:
+                close_old_connections()
+        if response.status_code >= 400:
+            raise BenchmarkError(f'{response.status_code}: {getattr(response, "data", response.content)!r}')
+        return response
+
+    for _ in range(warmup):
+        call()
+
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        call()
+        timings.append((time.perf_counter() - started) * 1000)
+
+    tracemalloc.start()
+    try:
+        with CaptureQueriesContext(connection) as ctx:
+            call()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'iterations': iterations,
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'p99_ms': round(percentile(timings, 99), 3),
+        'max_ms': round(max(timings), 3),
+        'queries': len(ctx.captured_queries),
+        'memory_kb': round(peak / 1024, 1),
+    }
+
+
+def dataset_size() -> dict:
+    return {
+        'users': CustomUser.objects.count(),
+        'courses': Course.objects.count(),
+        'lessons': Lesson.objects.count(),
+        'subscriptions': Subscription.objects.count(),
+        'payments': Payment.objects.count(),
+    }
+
+
+def run(user, *, only=None, iterations=50, warmup=5, cold_cache=False, recycle_connections=False) -> dict:
+    client = auth_client(user)
+    results = {}
+    with isolated_cache(), mock.patch('users.stripe_checkout.StripeGateway', StubGateway):
+        for name, request in scenarios(user).items():
+            if only and name not in only:
+                continue
+            results[name] = measure(
+                request, client, iterations=iterations, warmup=warmup, cold_cache=cold_cache,
+                recycle_connections=recycle_connections,
+            )
+    return results
+
+
+def check_budgets(results: dict, budgets: dict) -> list[str]:
+    """Нарушения бюджетов в виде строк; пустой список — всё в пределах."""
+    violations = []
+    for name, metrics in results.items():
+        for metric, limit in budgets.get(name, {}).items():
+            if metrics[metric] > limit:
+                violations.append(f'{name}: {metric} = {metrics[metric]} > {limit}')
+    return violations
@@ -1,6 +1,9 @@
 from __future__ import absolute_import, unicode_literals
 import os
 from celery import Celery
+from celery.signals import before_task_publish, task_failure, task_postrun, task_prerun
+
+from config import task_metrics
 
 # Установка переменной окружения для настроек проекта
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
@@ -12,4 +15,10 @@ app = Celery('config')
 app.config_from_object('django.conf:settings', namespace='CELERY')
 
 # Автоматическое обнаружение и регистрация задач из файлов tasks.py в приложениях Django
-app.autodiscover_tasks()
\ No newline at end of file
+app.autodiscover_tasks()
+
+# Метрики задач: ожидание в очереди, время выполнения, SQL-запросы, медленные задачи
+before_task_publish.connect(task_metrics.stamp_published, weak=False)
+task_prerun.connect(task_metrics.task_started, weak=False)
+task_postrun.connect(task_metrics.task_finished, weak=False)
+task_failure.connect(task_metrics.task_failed, weak=False)
@@ -0,0 +1,113 @@
+"""
+Чтение с реплики (алиас replica), запись — всегда в default.
+Реплика используется только там, где это явно разрешено: ReplicaRoutingMiddleware
+разрешает её для безопасных HTTP-методов, а код вне запроса (задачи Celery, shell)
+по умолчанию читает с primary и включает реплику через replica_reads().
+Чтение остаётся на primary:
+- внутри транзакции (atomic) на default;
+- после записи в том же запросе или блоке;
+- в течение REPLICA_PIN_SECONDS после записи того же пользователя (по id из JWT через
+  identify() или по cookie для сессионных клиентов вроде админки), чтобы он видел свои изменения.
+View отказывается от реплики или требует её атрибутом use_replica = False/True.
+Запись сырым SQL должна брать алиас через router.db_for_write(), иначе закрепления не будет.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.permissions import SAFE_METHODS
+
+REPLICA = 'replica'
+PIN_COOKIE = 'db_primary'
+
+
+class Routing:
+    __slots__ = ('replica', 'pinned')
+
+    def __init__(self, replica: bool):
+        self.replica = replica
+        self.pinned = False
+
+
+_routing: ContextVar[Routing | None] = ContextVar('db_routing', default=None)
+
+
+def replica_configured() -> bool:
+    return REPLICA in settings.DATABASES
+
+
+def pin_key(user_id) -> str:
+    return f'db:pinned:{user_id}'
+
+
+@contextmanager
+def replica_reads(enabled: bool = True):
+    """Разрешить (или запретить при enabled=False) чтение с реплики внутри блока; годится и как декоратор."""
+    token = _routing.set(Routing(enabled))
+    try:
+        yield
+    finally:
+        _routing.reset(token)
+
+
+def primary_reads():
+    return replica_reads(False)
+
+
+def identify(user_id):
+    """Пользователь запроса известен: если он недавно писал, читать с primary."""
+    routing = _routing.get()
+    if routing is not None and routing.replica and cache.get(pin_key(user_id)):
+        routing.pinned = True
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        routing = _routing.get()
+        if routing is None or not routing.replica or routing.pinned or not replica_configured():
+            return DEFAULT_DB_ALIAS
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return REPLICA
+
+    def db_for_write(self, model, **hints):
+        routing = _routing.get()
+        if routing is not None:
+            routing.pinned = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaRoutingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        routing = Routing(request.method in SAFE_METHODS and PIN_COOKIE not in request.COOKIES)
+        token = _routing.set(routing)
+        try:
+            response = self.get_response(request)
+        finally:
+            _routing.reset(token)
+
+        if routing.pinned and request.method not in SAFE_METHODS:
+            # после view request.user — пользователь, которого установил DRF
+            user = getattr(request, 'user', None)
+            if user is not None and user.is_authenticated:
+                cache.set(pin_key(user.id), 1, settings.REPLICA_PIN_SECONDS)
+            response.set_cookie(PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS, httponly=True, samesite='Lax')
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+        choice = getattr(view_class, 'use_replica', None)
+        routing = _routing.get()
+        if choice is not None and routing is not None and not routing.pinned:
+            routing.replica = choice
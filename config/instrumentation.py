@@ -0,0 +1,159 @@
+"""
+Метрики HTTP-запросов. Число запросов и гистограмма задержки пишутся для каждого запроса;
+подробности (SQL через connection.execute_wrapper, время сериализации в блоках serialization()
+и рендеринга ответа, повторы одинаковых запросов) — только для доли METRICS_SAMPLE_RATE,
+чтобы накладные расходы оставались в пределах нескольких процентов.
+"""
+import logging
+import random
+import re
+import secrets
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+
+from django.conf import settings
+from django.db import connections
+from django.http import Http404, HttpResponse
+
+from .metrics import collect, registry, render_prometheus
+
+logger = logging.getLogger(__name__)
+
+IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+
+_serialization: ContextVar[list[float] | None] = ContextVar('metrics_serialization', default=None)
+
+
+def fingerprint(sql: str) -> str:
+    """Значения уже вынесены в параметры; схлопываем только списки IN разной длины."""
+    return IN_LIST.sub('IN (...)', sql)
+
+
+class QueryRecorder:
+    """execute_wrapper: число SQL-запросов, их суммарное время и повторы одинаковых запросов."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += perf_counter() - started
+            self.count += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    def duplicates(self, threshold: int) -> list[tuple[str, int]]:
+        return [(sql, n) for sql, n in self.fingerprints.most_common() if n >= threshold]
+
+    def record(self):
+        """Контекстный менеджер, подключающий запись ко всем соединениям с БД."""
+        stack = ExitStack()
+        for conn in connections.all():
+            stack.enter_context(conn.execute_wrapper(self))
+        return stack
+
+
+@contextmanager
+def serialization():
+    """
+    Время блока учитывается как сериализация, если запрос попал в выборку. Ленивые запросы
+    к БД внутри блока (prefetch при обходе queryset) входят и в это время, и в SQL.
+    """
+    spent = _serialization.get()
+    if spent is None:
+        yield
+        return
+    started = perf_counter()
+    try:
+        yield
+    finally:
+        spent[0] += perf_counter() - started
+
+
+def view_label(request) -> str:
+    match = getattr(request, 'resolver_match', None)
+    return match.route if match else '<unmatched>'
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = perf_counter()
+        recorder = None
+        if random.random() < settings.METRICS_SAMPLE_RATE:
+            recorder = QueryRecorder()
+            request._metrics_render = 0.0
+            request._metrics_serialize = [0.0]
+            token = _serialization.set(request._metrics_serialize)
+            try:
+                with recorder.record():
+                    response = self.get_response(request)
+            finally:
+                _serialization.reset(token)
+        else:
+            response = self.get_response(request)
+        total = perf_counter() - started
+
+        view = view_label(request)
+        registry.inc('http_requests_total', view=view, method=request.method, status=response.status_code)
+        registry.observe('http_request_duration_seconds', total, view=view)
+        if recorder is not None:
+            self.record_sampled(request, response, view, recorder, total)
+        registry.maybe_flush()
+        return response
+
+    def process_template_response(self, request, response):
+        """Время рендеринга ответа DRF (data -> JSON), который рендерится после view."""
+        if hasattr(request, '_metrics_render'):
+            started = perf_counter()
+
+            def rendered(response):
+                request._metrics_render = perf_counter() - started
+
+            response.add_post_render_callback(rendered)
+        return response
+
+    def record_sampled(self, request, response, view, recorder, total):
+        render = request._metrics_render
+        serialize = request._metrics_serialize[0]
+        registry.inc('http_sampled_requests_total', view=view)
+        registry.inc('db_queries_total', recorder.count, view=view)
+        registry.inc('db_query_seconds_total', recorder.duration, view=view)
+        registry.inc('http_serialize_seconds_total', serialize, view=view)
+        registry.inc('http_render_seconds_total', render, view=view)
+
+        duplicates = recorder.duplicates(settings.METRICS_DUPLICATE_QUERY_THRESHOLD)
+        for sql, n in duplicates:
+            registry.inc('db_duplicate_queries_total', n, view=view)
+            logger.warning('%s %s: запрос выполнен %d раз: %s', request.method, view, n, sql[:500])
+
+        if settings.METRICS_SERVER_TIMING:
+            response['Server-Timing'] = ', '.join((
+                f'db;dur={recorder.duration * 1000:.1f};desc="{recorder.count} queries"',
+                f'serialize;dur={serialize * 1000:.1f}',
+                f'render;dur={render * 1000:.1f}',
+                f'total;dur={total * 1000:.1f}',
+            ))
+
+
+def metrics_view(request):
+    """
+    Метрики всех процессов в текстовом формате Prometheus. Доступ по заголовку
+    Authorization: Bearer <METRICS_TOKEN>; без токена в настройках — только при DEBUG.
+    """
+    token = settings.METRICS_TOKEN
+    if token:
+        if not secrets.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return HttpResponse(status=401)
+    elif not settings.DEBUG:
+        raise Http404
+    registry.flush()
+    return HttpResponse(render_prometheus(collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
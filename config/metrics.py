@@ -0,0 +1,125 @@
+"""
+Счётчики и гистограммы в памяти процесса. Каждый процесс (web-воркер, celery-воркер)
+раз в METRICS_FLUSH_INTERVAL секунд кладёт свой снимок в общий кеш, а /metrics
+суммирует снимки всех живых процессов и отдаёт их в текстовом формате Prometheus.
+Снимок умершего процесса истекает по TTL, что для Prometheus выглядит как сброс счётчика.
+"""
+import os
+import socket
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+
+WORKERS_KEY = 'metrics:workers'
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def labels_key(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = defaultdict(float)
+        self.histograms = {}
+        self.flushed_at = time.monotonic()
+
+    def inc(self, name: str, value: float = 1, **labels):
+        with self.lock:
+            self.counters[(name, labels_key(labels))] += value
+
+    def observe(self, name: str, value: float, **labels):
+        """Гистограмма: счётчики по BUCKETS (не накопительные), затем сумма и количество."""
+        key = (name, labels_key(labels))
+        with self.lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = [0] * (len(BUCKETS) + 2)
+            for i, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    hist[i] += 1
+                    break
+            hist[-2] += value
+            hist[-1] += 1
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                'counters': dict(self.counters),
+                'histograms': {key: list(hist) for key, hist in self.histograms.items()},
+            }
+
+    def worker_key(self) -> str:
+        # pid берётся при каждой выгрузке: после fork у дочернего процесса свой ключ
+        return f'metrics:worker:{socket.gethostname()}:{os.getpid()}'
+
+    def flush(self):
+        interval = settings.METRICS_FLUSH_INTERVAL
+        key = self.worker_key()
+        cache.set(key, self.snapshot(), interval * 6)
+        workers = cache.get(WORKERS_KEY) or []
+        if key not in workers:
+            cache.set(WORKERS_KEY, workers + [key], None)
+        self.flushed_at = time.monotonic()
+
+    def maybe_flush(self):
+        if time.monotonic() - self.flushed_at >= settings.METRICS_FLUSH_INTERVAL:
+            self.flush()
+
+
+registry = Registry()
+
+
+def collect() -> dict:
+    """Сумма снимков всех процессов; ключи истёкших процессов убираются из списка."""
+    workers = cache.get(WORKERS_KEY) or []
+    snapshots = cache.get_many(workers)
+    if len(snapshots) != len(workers):
+        cache.set(WORKERS_KEY, [key for key in workers if key in snapshots], None)
+
+    merged = {'counters': defaultdict(float), 'histograms': {}}
+    for snapshot in snapshots.values():
+        for key, value in snapshot['counters'].items():
+            merged['counters'][key] += value
+        for key, hist in snapshot['histograms'].items():
+            total = merged['histograms'].setdefault(key, [0] * len(hist))
+            for i, value in enumerate(hist):
+                total[i] += value
+    return merged
+
+
+def escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels: tuple, **extra) -> str:
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{escape(v)}"' for k, v in pairs) + '}'
+
+
+def render_prometheus(metrics: dict) -> str:
+    lines = []
+    for name in sorted({name for name, _ in metrics['counters']}):
+        lines.append(f'# TYPE {name} counter')
+        for (metric, labels), value in sorted(metrics['counters'].items()):
+            if metric == name:
+                lines.append(f'{name}{format_labels(labels)} {value:.15g}')
+    for name in sorted({name for name, _ in metrics['histograms']}):
+        lines.append(f'# TYPE {name} histogram')
+        for (metric, labels), hist in sorted(metrics['histograms'].items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(BUCKETS, hist):
+                cumulative += count
+                lines.append(f'{name}_bucket{format_labels(labels, le=f"{bound:g}")} {cumulative}')
+            lines.append(f'{name}_bucket{format_labels(labels, le="+Inf")} {hist[-1]}')
+            lines.append(f'{name}_sum{format_labels(labels)} {hist[-2]:.15g}')
+            lines.append(f'{name}_count{format_labels(labels)} {hist[-1]}')
+    return '\n'.join(lines) + '\n'
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
 import os
+import sys
 from datetime import timedelta
 
 from dotenv import load_dotenv
@@ -43,6 +44,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     'rest_framework',
     'lms',
     'users',
@@ -54,7 +56,7 @@ INSTALLED_APPS = [
 ]
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "users.authentication.ClaimsJWTAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": (
         "rest_framework.permissions.IsAuthenticated",  # по умолчанию всё закрыто
@@ -70,10 +72,14 @@ SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=15),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
 }
+# Сколько секунд GET-запросы доверяют закешированным token_version/is_active/is_staff
+JWT_USER_STATE_TTL = 60
 
 AUTH_USER_MODEL = 'users.CustomUser'
 
 MIDDLEWARE = [
+    "config.instrumentation.MetricsMiddleware",
+    "config.db_router.ReplicaRoutingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -86,6 +92,17 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = "config.urls"
 
+# Метрики запросов (config.instrumentation): доля запросов с подробным замером SQL, сериализации и рендеринга
+METRICS_SAMPLE_RATE = float(os.getenv('METRICS_SAMPLE_RATE', 0.1))
+# Заголовок Server-Timing в ответах, попавших в выборку
+METRICS_SERVER_TIMING = os.getenv('METRICS_SERVER_TIMING', str(DEBUG)) == 'True'
+# С какого числа повторов одинаковый SQL в одном запросе попадает в лог
+METRICS_DUPLICATE_QUERY_THRESHOLD = int(os.getenv('METRICS_DUPLICATE_QUERY_THRESHOLD', 3))
+# Как часто процесс выгружает свои счётчики в кеш для /metrics (секунды)
+METRICS_FLUSH_INTERVAL = int(os.getenv('METRICS_FLUSH_INTERVAL', 10))
+# Bearer-токен для /metrics; пустой — эндпоинт доступен только при DEBUG
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
 TEMPLATES = [
     {
         "BACKEND": "django.template.backends.django.DjangoTemplates",
@@ -106,18 +123,52 @@ WSGI_APPLICATION = "config.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Процесс, для которого читаются настройки: web или celery. Воркерам Celery задавайте
+# PROCESS_ROLE=celery явно; без неё роль угадывается по sys.argv (команда celery
+# или python -m celery). Параметры соединений можно задать отдельно для каждой роли
+# переменными с суффиксом, например DB_CONN_MAX_AGE_CELERY.
+PROCESS_ROLE = os.getenv('PROCESS_ROLE') or (
+    'celery' if 'celery' in (Path(sys.argv[0]).name, Path(sys.argv[0]).parent.name) else 'web'
+)
+
+
+def role_env(name, default):
+    return os.getenv(f'{name}_{PROCESS_ROLE.upper()}', os.getenv(name, default))
+
+
+# Постоянные соединения живут DB_CONN_MAX_AGE секунд и перед переиспользованием
+# проверяются (DB_CONN_HEALTH_CHECKS). Пул соединений psycopg 3 не используется:
+# проект работает на psycopg2. За PgBouncer в режиме transaction нужен
+# DB_DISABLE_SERVER_SIDE_CURSORS=True.
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.postgresql_psycopg2",
+        "ENGINE": "django.db.backends.postgresql",
         "NAME": os.getenv('POSTGRES_DB'),
         'USER': os.getenv('POSTGRES_USER'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD'),
         'HOST': os.getenv('POSTGRES_HOST'),
-        'PORT': os.getenv('POSTGRES_PORT')
-
+        'PORT': os.getenv('POSTGRES_PORT'),
+        'CONN_MAX_AGE': int(role_env('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': os.getenv('DB_CONN_HEALTH_CHECKS', 'True') == 'True',
+        'DISABLE_SERVER_SIDE_CURSORS': os.getenv('DB_DISABLE_SERVER_SIDE_CURSORS', 'False') == 'True',
     }
 }
 
+# Реплика для чтения (config/db_router.py). POSTGRES_REPLICA_HOST — отдельный сервер;
+# DB_REPLICA=True без хоста — второй алиас на тот же сервер, чтобы проверить маршрутизацию локально.
+if os.getenv('POSTGRES_REPLICA_HOST') or os.getenv('DB_REPLICA', 'False') == 'True':
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': os.getenv('POSTGRES_REPLICA_HOST') or DATABASES['default']['HOST'],
+        'PORT': os.getenv('POSTGRES_REPLICA_PORT') or DATABASES['default']['PORT'],
+        'USER': os.getenv('POSTGRES_REPLICA_USER') or DATABASES['default']['USER'],
+        'PASSWORD': os.getenv('POSTGRES_REPLICA_PASSWORD') or DATABASES['default']['PASSWORD'],
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['config.db_router.PrimaryReplicaRouter']
+# Сколько секунд после записи пользователь читает с primary (задержка репликации с запасом)
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', 5))
+
 CACHES = {
     "default": {
         "BACKEND": "django.core.cache.backends.redis.RedisCache",
@@ -125,6 +176,11 @@ CACHES = {
     }
 }
 
+# Время жизни закешированных тел курсов и уроков (секунды)
+LMS_CACHE_TTL = 60 * 15
+# Максимум элементов в одном запросе к bulk-эндпоинтам уроков и подписок
+LMS_BULK_MAX_ITEMS = int(os.getenv('LMS_BULK_MAX_ITEMS', 10000))
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -188,10 +244,20 @@ EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD')
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 PASSWORD_RESET_TIMEOUT = 60 * 60 * 24
+# Сколько адресатов получает одна подзадача рассылки об обновлении курса
+COURSE_EMAIL_CHUNK_SIZE = int(os.getenv('COURSE_EMAIL_CHUNK_SIZE', 500))
+# Серия правок курса в пределах этого интервала даёт одну задачу уведомления
+COURSE_UPDATE_DEBOUNCE_SECONDS = int(os.getenv('COURSE_UPDATE_DEBOUNCE_SECONDS', 60))
+# За какой период собирать обновления в первую сводку пользователя
+COURSE_DIGEST_PERIOD = timedelta(days=1)
 
 
 STRIPE_SECRET_KEY = os.getenv('STRIPE_SECRET_KEY', '')
 STRIPE_CURRENCY = os.getenv('STRIPE_CURRENCY', 'rub')
+# Создавать Checkout Session в Celery и отвечать 202 вместо ожидания Stripe в запросе
+STRIPE_CHECKOUT_ASYNC = os.getenv('STRIPE_CHECKOUT_ASYNC', 'False') == 'True'
+# Через сколько секунд клиенту повторить опрос /payments/<id>/status/ (заголовок Retry-After)
+PAYMENT_STATUS_RETRY_AFTER = int(os.getenv('PAYMENT_STATUS_RETRY_AFTER', 1))
 
 REDIS_URL = f'redis://{REDIS_HOST}:{REDIS_PORT}'
 REDIS_CACHE_URL = f'redis://{REDIS_HOST}:{REDIS_PORT}/1'
@@ -210,11 +276,27 @@ CELERY_TASK_TRACK_STARTED = True
 # Максимальное время на выполнение задачи
 CELERY_TASK_TIME_LIMIT = 30 * 60
 
+# Задачи дольше этого (секунды) попадают в журнал медленных задач (config.task_metrics)
+CELERY_SLOW_TASK_SECONDS = float(os.getenv('CELERY_SLOW_TASK_SECONDS', 5))
+CELERY_SLOW_TASK_LOG_SIZE = 100
+
+# Деактивация неактивных пользователей: размер пачки и пауза между пачками (секунды)
+DEACTIVATE_USERS_BATCH_SIZE = int(os.getenv('DEACTIVATE_USERS_BATCH_SIZE', 1000))
+DEACTIVATE_USERS_BATCH_PAUSE = float(os.getenv('DEACTIVATE_USERS_BATCH_PAUSE', 0.05))
+
 CELERY_BEAT_SCHEDULER = "django_celery_beat.schedulers:DatabaseScheduler"
 
 CELERY_BEAT_SCHEDULE = {
-    'run-my-task-every-minute': {
-        'task': 'homework_august.users.deactivate_inactive_users.',
-        'schedule': crontab(day='*/1'),
+    'deactivate-inactive-users': {
+        'task': 'users.tasks.deactivate_inactive_users',
+        'schedule': crontab(hour=3, minute=0),
+    },
+    'send-course-digest': {
+        'task': 'lms.tasks.send_course_digest',
+        'schedule': crontab(hour=8, minute=0),
+    },
+    'refresh-payment-rollup': {
+        'task': 'users.tasks.refresh_payment_rollup',
+        'schedule': crontab(minute='*/15'),
     },
 }
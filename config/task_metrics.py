@@ -0,0 +1,106 @@
+"""
+Метрики задач Celery: обработчики сигналов подключаются в config/celery.py.
+Для каждой задачи пишутся число запусков по итоговому состоянию, время выполнения,
+ожидание в очереди (от публикации или ETA до старта), число SQL-запросов; сами задачи
+добавляют свои счётчики через event() и timing(). Задачи дольше CELERY_SLOW_TASK_SECONDS
+попадают в скользящий журнал в кеше.
+"""
+import logging
+import time
+from datetime import datetime
+
+from celery import current_task
+from django.conf import settings
+from django.core.cache import cache
+
+from .instrumentation import QueryRecorder
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+
+SLOW_TASKS_KEY = 'metrics:slow_tasks'
+
+# task_id -> (started, queue_wait, recorder, stack); между prerun и postrun одного процесса
+_running = {}
+
+
+def current_task_name() -> str | None:
+    if not current_task or not current_task.request.id:
+        return None
+    return current_task.name
+
+
+def event(name: str, value: float = 1):
+    """Прибавить value к счётчику события текущей задачи; вне задачи ничего не делает."""
+    task = current_task_name()
+    if task:
+        registry.inc('celery_task_events_total', value, task=task, event=name)
+
+
+def timing(name: str, seconds: float):
+    """Длительность шага внутри текущей задачи (например, удержания блокировки)."""
+    task = current_task_name()
+    if task:
+        registry.observe('celery_task_step_seconds', seconds, task=task, step=name)
+
+
+def stamp_published(headers=None, **kwargs):
+    if headers is not None:
+        headers.setdefault('published_at', time.time())
+
+
+def queue_wait(request) -> float | None:
+    published = request.get('published_at')
+    if published is None:
+        return None
+    ready = published
+    if request.eta:
+        eta = request.eta if isinstance(request.eta, datetime) else datetime.fromisoformat(request.eta)
+        ready = max(ready, eta.timestamp())
+    return max(0.0, time.time() - ready)
+
+
+def task_started(task_id=None, task=None, **kwargs):
+    recorder = QueryRecorder()
+    stack = recorder.record()
+    stack.__enter__()
+    _running[task_id] = (time.monotonic(), queue_wait(task.request), recorder, stack)
+
+
+def task_finished(task_id=None, task=None, state=None, args=None, **kwargs):
+    running = _running.pop(task_id, None)
+    if running is None:
+        return
+    started, wait, recorder, stack = running
+    stack.__exit__(None, None, None)
+    runtime = time.monotonic() - started
+
+    registry.inc('celery_tasks_total', task=task.name, state=state or 'UNKNOWN')
+    registry.observe('celery_task_runtime_seconds', runtime, task=task.name)
+    if wait is not None:
+        registry.observe('celery_task_queue_wait_seconds', wait, task=task.name)
+    registry.inc('celery_task_db_queries_total', recorder.count, task=task.name)
+    registry.inc('celery_task_db_query_seconds_total', recorder.duration, task=task.name)
+
+    if runtime >= settings.CELERY_SLOW_TASK_SECONDS:
+        remember_slow_task({
+            'task': task.name, 'id': task_id, 'state': state, 'at': time.time(),
+            'runtime': round(runtime, 3), 'queue_wait': None if wait is None else round(wait, 3),
+            'queries': recorder.count, 'args': repr(args)[:200],
+        })
+    registry.maybe_flush()
+
+
+def task_failed(sender=None, exception=None, **kwargs):
+    registry.inc('celery_task_failures_total', task=sender.name, exception=type(exception).__name__)
+
+
+def remember_slow_task(entry: dict):
+    logger.warning('Медленная задача %s (%s): %.3f с, %d SQL', entry['task'], entry['id'], entry['runtime'],
+                   entry['queries'])
+    log = cache.get(SLOW_TASKS_KEY) or []
+    cache.set(SLOW_TASKS_KEY, (log + [entry])[-settings.CELERY_SLOW_TASK_LOG_SIZE:], None)
+
+
+def slow_tasks() -> list[dict]:
+    return cache.get(SLOW_TASKS_KEY) or []
@@ -6,6 +6,8 @@ from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 
+from config.instrumentation import metrics_view
+
 schema_view = get_schema_view(
     openapi.Info(
         title="API Documentation",
@@ -21,6 +23,7 @@ schema_view = get_schema_view(
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
 
     path('api/lms/', include('lms.urls')),
     path('api/users/', include('users.urls')),
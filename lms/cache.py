@@ -0,0 +1,99 @@
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+
+from config.db_router import primary_reads
+
+HITS_KEY = 'lms:cache:hits'
+MISSES_KEY = 'lms:cache:misses'
+
+
+def version_key(kind: str, pk) -> str:
+    return f'lms:{kind}:{pk}:v'
+
+
+def subscriptions_key(user_id) -> str:
+    return f'lms:subscriptions:{user_id}'
+
+
+def bump(kind: str, *pks):
+    """
+    Инвалидировать закешированные тела объектов: новая случайная версия делает старые
+    ключи недостижимыми, а сами они истекают по TTL.
+    """
+    pks = [pk for pk in pks if pk is not None]
+    if pks:
+        cache.set_many({version_key(kind, pk): uuid4().hex for pk in pks}, settings.LMS_CACHE_TTL * 4)
+
+
+def get_versions(kind: str, pks) -> dict:
+    keys = {version_key(kind, pk): pk for pk in pks}
+    found = cache.get_many(list(keys))
+    missing = {key: uuid4().hex for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, settings.LMS_CACHE_TTL * 4)
+        found.update(missing)
+    return {keys[key]: version for key, version in found.items()}
+
+
+def cached_payloads(kind: str, pks, build, namespace: str = '') -> list:
+    """
+    Сериализованные тела объектов в порядке pks. Промахи собираются одним вызовом
+    build(missing_pks) -> {pk: payload} и кладутся в кеш под ключом текущей версии.
+    Промахи читаются с primary: тело, собранное с отстающей реплики сразу после bump(),
+    осталось бы в кеше под новой версией на весь TTL.
+    namespace разделяет варианты представления (например, хост для абсолютных URL).
+    """
+    pks = list(pks)
+    if not pks:
+        return []
+    versions = get_versions(kind, pks)
+    body_keys = {pk: f'lms:{kind}:{pk}:{versions[pk]}:{namespace}' for pk in pks}
+    found = cache.get_many(list(body_keys.values()))
+
+    payloads = {pk: found[key] for pk, key in body_keys.items() if key in found}
+    missing = [pk for pk in pks if pk not in payloads]
+    if missing:
+        with primary_reads():
+            built = build(missing)
+        cache.set_many({body_keys[pk]: built[pk] for pk in missing if pk in built}, settings.LMS_CACHE_TTL)
+        payloads.update(built)
+
+    record_stats(hits=len(pks) - len(missing), misses=len(missing))
+    return [dict(payloads[pk]) for pk in pks if pk in payloads]
+
+
+def subscribed_course_ids(user) -> set:
+    """Курсы, на которые подписан пользователь; общий для всех его запросов набор в кеше (заполняется с primary)."""
+    if not user or not user.is_authenticated:
+        return set()
+    key = subscriptions_key(user.id)
+    ids = cache.get(key)
+    if ids is None:
+        from .models import Subscription
+        with primary_reads():
+            ids = list(Subscription.objects.filter(user_id=user.id).values_list('course_id', flat=True))
+        cache.set(key, ids, settings.LMS_CACHE_TTL)
+    return set(ids)
+
+
+def forget_subscriptions(*user_ids):
+    cache.delete_many([subscriptions_key(pk) for pk in user_ids])
+
+
+def record_stats(*, hits: int, misses: int):
+    for key, value in ((HITS_KEY, hits), (MISSES_KEY, misses)):
+        if not value:
+            continue
+        try:
+            cache.incr(key, value)
+        except ValueError:
+            cache.set(key, value, None)
+
+
+def cache_stats() -> dict:
+    values = cache.get_many([HITS_KEY, MISSES_KEY])
+    hits, misses = values.get(HITS_KEY, 0), values.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {'hits': hits, 'misses': misses, 'hit_rate': round(hits / total, 4) if total else None}
@@ -0,0 +1,25 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+
+
+def make_validators(*parts, last_modified=None):
+    """(ETag, Last-Modified в секундах) из дешёвых агрегатов вместо сериализованного тела."""
+    digest = hashlib.md5('|'.join(str(p) for p in parts).encode(), usedforsecurity=False).hexdigest()
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    return quote_etag(digest), timestamp
+
+
+def not_modified(request, validators):
+    """304 (или 412), если клиентская копия актуальна; иначе None."""
+    etag, last_modified = validators
+    return get_conditional_response(request, etag=etag, last_modified=last_modified)
+
+
+def set_validators(response, validators):
+    etag, last_modified = validators
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
@@ -0,0 +1,74 @@
+from collections import defaultdict
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+
+from config.metrics import BUCKETS, collect
+from config.task_metrics import slow_tasks
+
+
+def histogram_quantile(hist, q):
+    """Верхняя граница корзины, в которую попадает квантиль q."""
+    target = q * hist[-1]
+    seen = 0
+    for bound, count in zip(BUCKETS, hist):
+        seen += count
+        if seen >= target:
+            return bound
+    return float('inf')
+
+
+class Command(BaseCommand):
+    help = 'Сводка по задачам Celery: запуски, ошибки, время, ожидание в очереди, SQL, события и медленные задачи'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--slow', type=int, default=10, help='Сколько последних медленных задач показать')
+
+    def handle(self, *args, **options):
+        metrics = collect()
+        tasks = defaultdict(lambda: {'states': {}, 'events': {}, 'queries': 0, 'runtime': None, 'wait': None})
+        for (name, labels), value in metrics['counters'].items():
+            labels = dict(labels)
+            if 'task' not in labels:
+                continue
+            stats = tasks[labels['task']]
+            if name == 'celery_tasks_total':
+                stats['states'][labels['state']] = int(value)
+            elif name == 'celery_task_events_total':
+                stats['events'][labels['event']] = value
+            elif name == 'celery_task_db_queries_total':
+                stats['queries'] = value
+        for (name, labels), hist in metrics['histograms'].items():
+            labels = dict(labels)
+            if name == 'celery_task_runtime_seconds':
+                tasks[labels['task']]['runtime'] = hist
+            elif name == 'celery_task_queue_wait_seconds':
+                tasks[labels['task']]['wait'] = hist
+
+        if not tasks:
+            self.stdout.write('Метрик задач пока нет.')
+        for task, stats in sorted(tasks.items()):
+            runs = sum(stats['states'].values())
+            self.stdout.write(self.style.MIGRATE_HEADING(task))
+            states = ', '.join(f'{k}: {v}' for k, v in sorted(stats['states'].items()))
+            self.stdout.write(f'  запуски: {runs} ({states})')
+            for title, hist in (('выполнение', stats['runtime']), ('ожидание в очереди', stats['wait'])):
+                if hist and hist[-1]:
+                    self.stdout.write(
+                        f'  {title}: среднее {hist[-2] / hist[-1]:.3f} с, '
+                        f'p95 ≤ {histogram_quantile(hist, 0.95):g} с'
+                    )
+            if runs:
+                self.stdout.write(f"  SQL на запуск: {stats['queries'] / runs:.1f}")
+            for name, value in sorted(stats['events'].items()):
+                self.stdout.write(f'  {name}: {value:g}')
+
+        entries = slow_tasks()[-options['slow']:]
+        if entries:
+            self.stdout.write(self.style.WARNING('Медленные задачи:'))
+            for entry in reversed(entries):
+                at = datetime.fromtimestamp(entry['at']).isoformat(timespec='seconds')
+                self.stdout.write(
+                    f"  {at} {entry['task']} {entry['runtime']:.3f} с, SQL {entry['queries']}, "
+                    f"очередь {entry['queue_wait']} с, {entry['state']} {entry['args']}"
+                )
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from lms.cache import cache_stats
+
+
+class Command(BaseCommand):
+    help = 'Показать попадания/промахи кеша курсов и уроков'
+
+    def handle(self, *args, **options):
+        stats = cache_stats()
+        rate = 'нет данных' if stats['hit_rate'] is None else f"{stats['hit_rate']:.1%}"
+        self.stdout.write(f"hits: {stats['hits']}, misses: {stats['misses']}, hit rate: {rate}")
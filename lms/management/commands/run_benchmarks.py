@@ -0,0 +1,98 @@
+import json
+import platform
+from contextlib import nullcontext
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import override_settings
+from django.utils.timezone import now
+
+from config import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        'Замерить горячие пути API (задержка, SQL-запросы, память) на текущей базе, '
+        'сохранить результат в JSON и упасть при превышении бюджетов. '
+        'Все изменения, сделанные сценариями, откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--email', help='Пользователь, от имени которого идут запросы (по умолчанию первый)')
+        parser.add_argument('--label', default='', help='Метка прогона, например размер данных: 1k, 100k, 1m')
+        parser.add_argument('--only', nargs='+', metavar='SCENARIO', help='Запустить только эти сценарии')
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument(
+            '--cold-cache', action='store_true',
+            help='Каждый запрос с пустым кешем (свой префикс ключей; общий кеш не очищается)',
+        )
+        parser.add_argument(
+            '--real-connections', action='store_true',
+            help='Закрывать устаревшие соединения после каждого запроса, как обработчик WSGI '
+                 '(показывает эффект CONN_MAX_AGE). Только сценарии чтения, без транзакции-обёртки.',
+        )
+        parser.add_argument('--output', default='bench_output.json', help='Куда записать результат')
+        parser.add_argument('--budgets', help='JSON с бюджетами вместо встроенных')
+        parser.add_argument('--compare', help='JSON предыдущего прогона для сравнения p95')
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        users = User.objects.filter(is_active=True).order_by('id')
+        user = users.filter(email=options['email']).first() if options['email'] else users.first()
+        if user is None:
+            raise CommandError('Пользователь не найден.')
+        budgets = benchmarks.BUDGETS
+        if options['budgets']:
+            budgets = json.loads(Path(options['budgets']).read_text())
+
+        only = options['only']
+        if options['real_connections']:
+            only = [name for name in (only or benchmarks.READ_ONLY) if name in benchmarks.READ_ONLY]
+            # вне транзакции: внутри неё Django не закрывает соединения
+            wrapper = nullcontext()
+        else:
+            wrapper = transaction.atomic()
+
+        with override_settings(ALLOWED_HOSTS=['*']), wrapper:
+            try:
+                results = benchmarks.run(
+                    user, only=only, iterations=options['iterations'], warmup=options['warmup'],
+                    cold_cache=options['cold_cache'], recycle_connections=options['real_connections'],
+                )
+            except benchmarks.BenchmarkError as exc:
+                raise CommandError(str(exc))
+            size = benchmarks.dataset_size()
+            if not options['real_connections']:
+                transaction.set_rollback(True)
+
+        report = {
+            'label': options['label'],
+            'started_at': now().isoformat(),
+            'python': platform.python_version(),
+            'user': user.email,
+            'cold_cache': options['cold_cache'],
+            'real_connections': options['real_connections'],
+            'database': {
+                key: connection.settings_dict.get(key) for key in ('CONN_MAX_AGE', 'CONN_HEALTH_CHECKS')
+            },
+            'dataset': size,
+            'results': results,
+        }
+        Path(options['output']).write_text(json.dumps(report, ensure_ascii=False, indent=2))
+
+        previous = json.loads(Path(options['compare']).read_text())['results'] if options['compare'] else {}
+        for name, m in results.items():
+            line = (f"{name:<20} p50 {m['p50_ms']:>8.2f} ms  p95 {m['p95_ms']:>8.2f} ms  "
+                    f"p99 {m['p99_ms']:>8.2f} ms  queries {m['queries']:>3}  mem {m['memory_kb']:>8.1f} KB")
+            if name in previous:
+                line += f"  Δp95 {m['p95_ms'] - previous[name]['p95_ms']:+.2f} ms"
+            self.stdout.write(line)
+        self.stdout.write(f"Результат записан в {options['output']}")
+
+        violations = benchmarks.check_budgets(results, budgets)
+        if violations:
+            raise CommandError('Превышены бюджеты:\n' + '\n'.join(violations))
+        self.stdout.write(self.style.SUCCESS('Все бюджеты соблюдены'))
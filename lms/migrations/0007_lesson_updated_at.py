@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:10
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("lms", "0006_course_last_notification_sent_course_updated_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="lesson",
+            name="updated_at",
+            field=models.DateTimeField(
+                auto_now=True, default=django.utils.timezone.now
+            ),
+            preserve_default=False,
+        ),
+    ]
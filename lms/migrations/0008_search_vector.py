@@ -0,0 +1,71 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:52
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.conf import settings
+from django.db import migrations
+
+
+def trigger_sql(table):
+    return f"""
+    CREATE FUNCTION {table}_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('russian', coalesce(NEW.name, '')), 'A') ||
+            setweight(to_tsvector('russian', coalesce(NEW.description, '')), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql;
+
+    CREATE TRIGGER {table}_search_vector_trigger
+        BEFORE INSERT OR UPDATE OF name, description ON {table}
+        FOR EACH ROW EXECUTE FUNCTION {table}_search_vector_update();
+
+    UPDATE {table} SET name = name;
+    """
+
+
+def drop_trigger_sql(table):
+    return f"""
+    DROP TRIGGER IF EXISTS {table}_search_vector_trigger ON {table};
+    DROP FUNCTION IF EXISTS {table}_search_vector_update();
+    """
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("lms", "0007_lesson_updated_at"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="course",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="lesson",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="course",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_vector"], name="lms_course_search_gin"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="lesson",
+            index=django.contrib.postgres.indexes.GinIndex(
+                fields=["search_vector"], name="lms_lesson_search_gin"
+            ),
+        ),
+        migrations.RunSQL(trigger_sql("lms_course"), drop_trigger_sql("lms_course")),
+        migrations.RunSQL(trigger_sql("lms_lesson"), drop_trigger_sql("lms_lesson")),
+    ]
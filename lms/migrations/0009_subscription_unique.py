@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:56
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def drop_duplicate_subscriptions(apps, schema_editor):
+    """Оставить по одной (самой ранней) подписке на пару (user, course)."""
+    Subscription = apps.get_model("lms", "Subscription")
+    duplicates = (
+        Subscription.objects.order_by()
+        .values("user_id", "course_id")
+        .annotate(n=Count("id"), keep=Min("id"))
+        .filter(n__gt=1)
+    )
+    for row in duplicates.iterator():
+        Subscription.objects.filter(
+            user_id=row["user_id"], course_id=row["course_id"]
+        ).exclude(pk=row["keep"]).delete()
+
+
+class Migration(migrations.Migration):
+    # уникальный индекс строится CONCURRENTLY, без блокировки записи в lms_subscription,
+    # и затем становится ограничением через ADD CONSTRAINT ... USING INDEX
+    atomic = False
+
+    dependencies = [
+        ("lms", "0008_search_vector"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_subscriptions, migrations.RunPython.noop),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS lms_subscription_user_course_uniq "
+                    "ON lms_subscription (user_id, course_id)",
+                    "DROP INDEX CONCURRENTLY IF EXISTS lms_subscription_user_course_uniq",
+                ),
+                migrations.RunSQL(
+                    "ALTER TABLE lms_subscription ADD CONSTRAINT lms_subscription_user_course_uniq "
+                    "UNIQUE USING INDEX lms_subscription_user_course_uniq",
+                    "ALTER TABLE lms_subscription DROP CONSTRAINT lms_subscription_user_course_uniq",
+                ),
+            ],
+            state_operations=[
+                migrations.AddConstraint(
+                    model_name="subscription",
+                    constraint=models.UniqueConstraint(
+                        fields=("user", "course"),
+                        name="lms_subscription_user_course_uniq",
+                    ),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:24
+
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ("lms", "0009_subscription_unique"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="course",
+            index=models.Index(fields=["name", "id"], name="lms_course_name_id_idx"),
+        ),
+    ]
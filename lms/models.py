@@ -1,8 +1,50 @@
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVectorField
+from django.db import connections, models, router
+from django.db.models import Count, Exists, F, FloatField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
+# Конфигурация полнотекстового поиска; те же веса и конфиг используют триггеры из миграции 0008
+SEARCH_CONFIG = 'russian'
+# Вклад совпадений в уроках в ранг курса
+LESSON_RANK_WEIGHT = 0.5
+
+
+def search_query(text: str) -> SearchQuery:
+    return SearchQuery(text, config=SEARCH_CONFIG, search_type='websearch')
+
+
+class CourseQuerySet(models.QuerySet):
+    def with_stats(self, user=None):
+        """Аннотирует lessons_count и is_subscribed одним запросом вместо запроса на каждую строку."""
+        qs = self.annotate(lessons_count=Count('lessons', distinct=True))
+        if user is not None and user.is_authenticated:
+            subscribed = Subscription.objects.filter(user_id=user.id, course=OuterRef('pk'))
+            return qs.annotate(is_subscribed=Exists(subscribed))
+        return qs.annotate(is_subscribed=Value(False))
+
+    def search(self, text: str):
+        """
+        Курсы, у которых совпало название/описание или хотя бы один урок, по убыванию ранга.
+        Совпадения уроков сворачиваются в курс как лучший ранг урока с весом LESSON_RANK_WEIGHT.
+        """
+        query = search_query(text)
+        lessons = Lesson.objects.filter(course=OuterRef('pk'), search_vector=query)
+        best_lesson_rank = (
+            lessons.annotate(rank=SearchRank(F('search_vector'), query)).order_by('-rank').values('rank')[:1]
+        )
+        return (
+            self.filter(Q(search_vector=query) | Exists(lessons))
+            .annotate(rank=(
+                Coalesce(SearchRank(F('search_vector'), query), Value(0.0), output_field=FloatField())
+                + LESSON_RANK_WEIGHT * Coalesce(Subquery(best_lesson_rank), Value(0.0), output_field=FloatField())
+            ))
+            .order_by('-rank', 'id')
+        )
+
 
 class Course(models.Model):
     name = models.CharField(max_length=150, verbose_name='Название курса')
@@ -19,6 +61,10 @@ class Course(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2, default=0, verbose_name="Цена")
     updated_at = models.DateTimeField(auto_now=True)
     last_notification_sent = models.DateTimeField(null=True, blank=True)
+    # name (вес A) + description (вес B); заполняется триггером БД
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = CourseQuerySet.as_manager()
 
     def __str__(self):
         return self.name
@@ -27,6 +73,11 @@ class Course(models.Model):
         verbose_name = 'курс'
         verbose_name_plural = 'курсы'
         ordering = ['name']
+        indexes = [
+            GinIndex(fields=['search_vector'], name='lms_course_search_gin'),
+            # порядок списка и курсорной пагинации (CourseViewSet.cursor_ordering)
+            models.Index(fields=['name', 'id'], name='lms_course_name_id_idx'),
+        ]
 
 
 class Lesson(models.Model):
@@ -43,6 +94,9 @@ class Lesson(models.Model):
         blank=True,
         null=True
     )
+    updated_at = models.DateTimeField(auto_now=True)
+    # name (вес A) + description (вес B); заполняется триггером БД
+    search_vector = SearchVectorField(null=True, editable=False)
 
     def __str__(self):
         return self.name
@@ -51,6 +105,47 @@ class Lesson(models.Model):
         verbose_name = 'урок'
         verbose_name_plural = 'уроки'
         ordering = ['id']
+        indexes = [
+            GinIndex(fields=['search_vector'], name='lms_lesson_search_gin'),
+        ]
+
+
+class SubscriptionQuerySet(models.QuerySet):
+    def toggle(self, user_id: int, course_id: int):
+        """
+        Переключить подписку одним оператором: DELETE ... RETURNING, а если удалять было нечего —
+        INSERT ... ON CONFLICT DO NOTHING (дубли исключает уникальный индекс (user, course)).
+        Существование курса проверяется тем же оператором.
+        Возвращает None, если курса нет, иначе (is_subscribed, created). При гонке двух
+        подписок проигравшая получает (True, False): подписка уже есть, но создана не ею.
+        """
+        table = self.model._meta.db_table
+        course_table = Course._meta.db_table
+        # сырой SQL мимо ORM: спрашиваем роутер сами, чтобы запись закрепила чтения за primary
+        db = self._db or router.db_for_write(self.model)
+        with connections[db].cursor() as cursor:
+            cursor.execute(
+                f"""
+                WITH deleted AS (
+                    DELETE FROM {table} WHERE user_id = %(user)s AND course_id = %(course)s RETURNING id
+                ), inserted AS (
+                    INSERT INTO {table} (user_id, course_id, created_at)
+                    SELECT %(user)s, id, now() FROM {course_table}
+                    WHERE id = %(course)s AND NOT EXISTS (SELECT 1 FROM deleted)
+                    ON CONFLICT (user_id, course_id) DO NOTHING
+                    RETURNING id
+                )
+                SELECT
+                    EXISTS (SELECT 1 FROM {course_table} WHERE id = %(course)s),
+                    EXISTS (SELECT 1 FROM deleted),
+                    EXISTS (SELECT 1 FROM inserted)
+                """,
+                {'user': user_id, 'course': course_id},
+            )
+            course_exists, deleted, inserted = cursor.fetchone()
+        if not course_exists:
+            return None
+        return not deleted, inserted
 
 
 class Subscription(models.Model):
@@ -71,9 +166,14 @@ class Subscription(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = SubscriptionQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'подписка'
         verbose_name_plural = 'подписки'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'course'], name='lms_subscription_user_course_uniq'),
+        ]
 
     def __str__(self):
         return f"{self.user} → {self.course}"
@@ -1,7 +1,113 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class MyCursorPagination(CursorPagination):
+    """
+    Keyset-пагинация: страница выбирается по WHERE над индексированными колонками,
+    поэтому её стоимость не зависит от глубины. Порядок задаётся атрибутом
+    `cursor_ordering` у view, например ('name', 'id') или ('-paid_at', '-id'), и для него
+    нужен индекс по тем же колонкам. Другой порядок (?ordering=amount, ранг поиска ?q=)
+    курсором не листается: такой запрос получает 400, а не молча другой порядок.
+    """
+    page_size = 10
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    ordering = ('-id',)
+
+    def get_ordering(self, request, queryset, view):
+        ordering = getattr(view, 'cursor_ordering', None)
+        if not ordering:
+            return super().get_ordering(request, queryset, view)
+        ordering = tuple(ordering)
+        requested = tuple(queryset.query.order_by)
+        if requested != ordering[:len(requested)]:
+            raise ValidationError({'pagination': (
+                'Курсорная пагинация поддерживает только порядок '
+                f'{", ".join(ordering)}; используйте постраничную пагинацию.'
+            )})
+        return ordering
 
 
 class MyPagination(PageNumberPagination):
+    """
+    Постраничная пагинация с двумя опциями:
+    - ?pagination=cursor (или сам ?cursor=...) переключает на MyCursorPagination;
+    - ?count=false не выполняет COUNT(*): вместо него читается одна лишняя строка,
+      чтобы понять, есть ли следующая страница.
+    """
     page_size = 10
     page_size_query_param = 'page_size'
     max_page_size = 100
+    mode_query_param = 'pagination'
+    count_query_param = 'count'
+    cursor_class = MyCursorPagination
+
+    def __init__(self):
+        self.cursor_paginator = None
+        self.skip_count = False
+
+    def use_cursor(self, request):
+        return (
+            request.query_params.get(self.mode_query_param) == 'cursor'
+            or self.cursor_class.cursor_query_param in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.use_cursor(request):
+            self.cursor_paginator = self.cursor_class()
+            return self.cursor_paginator.paginate_queryset(queryset, request, view)
+
+        if request.query_params.get(self.count_query_param, '').lower() not in ('false', '0', 'no'):
+            return super().paginate_queryset(queryset, request, view)
+
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+        try:
+            number = int(request.query_params.get(self.page_query_param, 1))
+        except (TypeError, ValueError):
+            number = 0
+        if number < 1:
+            raise NotFound(self.invalid_page_message.format(page_number=number, message='Invalid page.'))
+
+        offset = (number - 1) * page_size
+        rows = list(queryset[offset:offset + page_size + 1])
+
+        self.skip_count = True
+        self.request = request
+        self.page_number = number
+        self.has_next = len(rows) > page_size
+        return rows[:page_size]
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        if self.skip_count:
+            return Response({
+                'count': None,
+                'next': self.get_next_link(),
+                'previous': self.get_previous_link(),
+                'results': data,
+            })
+        return super().get_paginated_response(data)
+
+    def get_next_link(self):
+        if not self.skip_count:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.page_query_param, self.page_number + 1)
+
+    def get_previous_link(self):
+        if not self.skip_count:
+            return super().get_previous_link()
+        if self.page_number <= 1:
+            return None
+        url = self.request.build_absolute_uri()
+        if self.page_number == 2:
+            return remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.page_query_param, self.page_number - 1)
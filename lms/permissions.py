@@ -1,10 +1,11 @@
 from rest_framework.permissions import BasePermission
 
+from .roles import is_moderator
+
 
 class IsModer(BasePermission):
     def has_permission(self, request, view):
-        u = request.user
-        return bool(u and u.is_authenticated and u.groups.filter(name='moderators').exists())
+        return is_moderator(request.user)
 
 
 class IsOwner(BasePermission):
@@ -22,4 +23,4 @@ class ModerOrOwner(BasePermission):
 class NotModer(BasePermission):
     def has_permission(self, request, view):
         u = request.user
-        return bool(u and u.is_authenticated and not u.groups.filter(name='moderators').exists())
+        return bool(u and u.is_authenticated and not is_moderator(u))
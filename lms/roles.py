@@ -0,0 +1,33 @@
+MODERATORS_GROUP = 'moderators'
+
+_MODERATOR_ATTR = '_is_moderator'
+
+
+def is_moderator(user) -> bool:
+    """
+    Состоит ли пользователь в группе модераторов.
+    Результат запоминается на объекте пользователя, т.е. живёт ровно один запрос:
+    permission-классы и get_queryset переиспользуют его без повторных запросов к БД.
+    """
+    if not user or not user.is_authenticated:
+        return False
+    cached = getattr(user, _MODERATOR_ATTR, None)
+    if cached is None:
+        cached = user.groups.filter(name=MODERATORS_GROUP).exists()
+        setattr(user, _MODERATOR_ATTR, cached)
+    return cached
+
+
+def sees_all(user) -> bool:
+    """Персонал и модераторы видят все курсы и уроки, остальные — только свои."""
+    return bool(user and user.is_authenticated and (user.is_staff or is_moderator(user)))
+
+
+def remember_roles(user, *, is_moderator: bool):
+    """Задать роль заранее, например из claims JWT, чтобы не обращаться к группам."""
+    setattr(user, _MODERATOR_ATTR, is_moderator)
+
+
+def reset_roles(user):
+    """Сбросить запомненные роли (например, после изменения групп)."""
+    user.__dict__.pop(_MODERATOR_ATTR, None)
@@ -3,7 +3,28 @@ from .models import Course, Lesson, Subscription
 from .validators import validate_youtube_url
 
 
+class CourseLookupField(serializers.PrimaryKeyRelatedField):
+    """
+    Курс по id; если в контексте есть context['courses'] ({id: Course}), берёт его оттуда,
+    чтобы пакетная валидация не делала запрос на каждый элемент.
+    """
+
+    def to_internal_value(self, data):
+        courses = self.context.get('courses')
+        if courses is None:
+            return super().to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            return courses[int(data)]
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        except KeyError:
+            self.fail('does_not_exist', pk_value=data)
+
+
 class LessonSerializer(serializers.ModelSerializer):
+    course = CourseLookupField(queryset=Course.objects.all(), label='Курс')
     video_url = serializers.URLField(
         required=False,
         allow_null=True,
@@ -12,26 +33,52 @@ class LessonSerializer(serializers.ModelSerializer):
     )
     class Meta:
         model = Lesson
-        fields = '__all__'
+        exclude = ('search_vector',)
         read_only_fields = ('owner',)
 
 
-class CourseSerializer(serializers.ModelSerializer):
+class CourseListSerializer(serializers.ModelSerializer):
+    """
+    Компактное представление курса для списков: только скалярные поля и счётчики, без уроков.
+    fields=[...] оставляет подмножество полей (sparse fieldset).
+    """
     is_subscribed = serializers.SerializerMethodField()
     lessons_count = serializers.SerializerMethodField()
-    lessons = LessonSerializer(many=True, read_only=True)
 
     class Meta:
         model = Course
-        fields = '__all__'
+        exclude = ('search_vector',)
         read_only_fields = ('owner',)
 
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
     def get_lessons_count(self, obj):
+        if hasattr(obj, 'lessons_count'):
+            return obj.lessons_count
         return obj.lessons.count()
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return bool(obj.is_subscribed)
         request = self.context.get("request")
         user = getattr(request, "user", None)
         if not user or not user.is_authenticated:
             return False
-        return Subscription.objects.filter(user=user, course=obj).exists()
+        return Subscription.objects.filter(user_id=user.id, course=obj).exists()
+
+
+class CourseSerializer(CourseListSerializer):
+    lessons = LessonSerializer(many=True, read_only=True)
+
+    class Meta(CourseListSerializer.Meta):
+        pass
+
+
+class SubscriptionItemSerializer(serializers.Serializer):
+    """Элемент пакетной подписки; user_id по умолчанию — текущий пользователь."""
+    user_id = serializers.IntegerField(required=False)
+    course_id = serializers.IntegerField()
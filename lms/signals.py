@@ -0,0 +1,44 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import cache as lms_cache
+from .models import Course, Lesson, Subscription
+from .roles import reset_roles
+
+User = get_user_model()
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def reset_roles_on_groups_change(sender, instance, action, reverse, **kwargs):
+    """Изменение групп пользователя сбрасывает роли, запомненные на этом объекте."""
+    if action in ('post_add', 'post_remove', 'post_clear') and not reverse:
+        reset_roles(instance)
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+def invalidate_course_cache(sender, instance, **kwargs):
+    lms_cache.bump('course', instance.pk)
+
+
+@receiver(pre_save, sender=Lesson)
+def remember_lesson_course(sender, instance, **kwargs):
+    """Урок мог переехать в другой курс — старый курс тоже нужно инвалидировать."""
+    if instance.pk:
+        instance._previous_course_id = (
+            Lesson.objects.filter(pk=instance.pk).values_list('course_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Lesson)
+@receiver(post_delete, sender=Lesson)
+def invalidate_lesson_cache(sender, instance, **kwargs):
+    lms_cache.bump('lesson', instance.pk)
+    lms_cache.bump('course', instance.course_id, getattr(instance, '_previous_course_id', None))
+
+
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+def invalidate_subscriptions_cache(sender, instance, **kwargs):
+    lms_cache.forget_subscriptions(instance.user_id)
@@ -1,35 +1,164 @@
+import time
+from itertools import groupby, islice
+from uuid import uuid4
+
 from celery import shared_task
-from django.core.mail import send_mail
+from django.core.cache import cache
+from django.core.mail import EmailMessage, get_connection
 from django.utils.timezone import now, timedelta
-from django.db import transaction
+from django.contrib.auth import get_user_model
+from django.db.models import F, Q, Value
+from django.db.models.functions import Coalesce
 from django.conf import settings
 
+from config.db_router import replica_reads
+from config.task_metrics import event, timing
+
+from .cache import bump
 from .models import Course, Subscription
 
+User = get_user_model()
+
 FOUR_HOURS = timedelta(hours=4)
 
 
+def chunked(iterable, size):
+    """Разбить итератор на списки по size элементов, не загружая его целиком."""
+    it = iter(iterable)
+    while chunk := list(islice(it, size)):
+        yield chunk
+
+
+def notify_course_updated(course_id: int) -> bool:
+    """
+    Запланировать email_course_updated через COURSE_UPDATE_DEBOUNCE_SECONDS.
+    Пока задача для курса ждёт своего запуска, повторные обновления ничего не ставят в очередь:
+    ключ в кеше (SET NX) хранит токен запланированной задачи, и задача снимает его сама.
+    Возвращает True, если задача была поставлена.
+    """
+    countdown = settings.COURSE_UPDATE_DEBOUNCE_SECONDS
+    token = uuid4().hex
+    # запас к TTL на случай задержки очереди; если задача потеряется, ключ всё равно истечёт
+    if not cache.add(debounce_key(course_id), token, timeout=countdown * 2 + 60):
+        return False
+    email_course_updated.apply_async((course_id,), {'debounce_token': token}, countdown=countdown)
+    return True
+
+
+def debounce_key(course_id: int) -> str:
+    return f'lms:course-updated:{course_id}'
+
+
 @shared_task
-def email_course_updated(course_id: int):
-    try:
-        with transaction.atomic():
-            course = Course.objects.select_for_update().get(id=course_id)
-
-            if course.last_notification_sent and course.last_notification_sent > now() - FOUR_HOURS:
-                return
-
-            recipient_list = Subscription.objects.filter(course=course).values_list('user__email', flat=True)
-
-            if recipient_list:
-                send_mail(
-                    subject=f'Курс "{course.name}" обновлён',
-                    message=f'В курсе "{course.name}" появились обновления.',
-                    from_email=getattr(settings, "DEFAULT_FROM_EMAIL", None) or "noreply@example.com",
-                    recipient_list=recipient_list,
-                    fail_silently=False,
-                )
+def email_course_updated(course_id: int, debounce_token: str | None = None):
+    """
+    Захватывает окно уведомлений курса одним условным UPDATE (блокировка строки держится
+    только на время этого оператора), затем потоково читает email подписчиков и раздаёт
+    их пачками по COURSE_EMAIL_CHUNK_SIZE в подзадачи send_course_update_chunk.
+    Возвращает число отправленных пачек.
+    """
+    if debounce_token and cache.get(debounce_key(course_id)) == debounce_token:
+        cache.delete(debounce_key(course_id))
+
+    claimed_at = now()
+    lock_started = time.monotonic()
+    claimed = (
+        Course.objects
+        .filter(pk=course_id)
+        .filter(Q(last_notification_sent__isnull=True) | Q(last_notification_sent__lte=claimed_at - FOUR_HOURS))
+        .update(last_notification_sent=claimed_at)
+    )
+    # UPDATE в autocommit: блокировка строки курса держится ровно время оператора
+    timing('course_row_lock', time.monotonic() - lock_started)
+    if not claimed:
+        event('skipped_notification_window')
+        return 0
+    # last_notification_sent входит в тело курса, а UPDATE не вызывает сигналов
+    bump('course', course_id)
 
-            course.last_notification_sent = now()
-            course.save(update_fields=["last_notification_sent"])
-    except Course.DoesNotExist:
-        pass
+    chunk_size = settings.COURSE_EMAIL_CHUNK_SIZE
+    emails = (
+        Subscription.objects
+        .filter(course_id=course_id, user__course_notifications=User.NotificationMode.INSTANT)
+        .exclude(user__email='')
+        .order_by('id')
+        .values_list('user__email', flat=True)
+        .iterator(chunk_size=chunk_size)
+    )
+
+    chunks = 0
+    for chunk in chunked(emails, chunk_size):
+        send_course_update_chunk.delay(course_id, chunk)
+        chunks += 1
+        event('recipients', len(chunk))
+    event('chunks', chunks)
+    return chunks
+
+
+@shared_task
+def send_course_update_chunk(course_id: int, emails: list[str]):
+    """Отправить каждому адресату отдельное письмо через одно SMTP-соединение."""
+    course = Course.objects.filter(pk=course_id).only('name').first()
+    if course is None or not emails:
+        return 0
+
+    from_email = getattr(settings, "DEFAULT_FROM_EMAIL", None) or "noreply@example.com"
+    messages = [
+        EmailMessage(
+            subject=f'Курс "{course.name}" обновлён',
+            body=f'В курсе "{course.name}" появились обновления.',
+            from_email=from_email,
+            to=[email],
+        )
+        for email in emails
+    ]
+    with get_connection(fail_silently=False) as connection:
+        sent = connection.send_messages(messages)
+    event('emails_sent', sent)
+    return sent
+
+
+@shared_task
+@replica_reads()
+def send_course_digest():
+    """
+    Одно письмо на подписчика в режиме «сводка» со всеми его курсами, обновлёнными
+    после предыдущей сводки (или за последние COURSE_DIGEST_PERIOD, если сводок ещё не было).
+    Пары (пользователь, курс) выбираются одним запросом по Subscription и группируются в памяти
+    по пользователю; письма уходят пачками через одно SMTP-соединение.
+    Выборка идёт с реплики: отставание на секунды для сводки несущественно.
+    Возвращает число отправленных писем.
+    """
+    run_at = now()
+    rows = (
+        Subscription.objects
+        .filter(user__is_active=True, user__course_notifications=User.NotificationMode.DIGEST)
+        .exclude(user__email='')
+        .alias(since=Coalesce('user__last_digest_sent_at', Value(run_at - settings.COURSE_DIGEST_PERIOD)))
+        .filter(course__updated_at__gt=F('since'), course__updated_at__lte=run_at)
+        .order_by('user_id', 'course__name')
+        .values_list('user_id', 'user__email', 'course__name')
+        .iterator(chunk_size=settings.COURSE_EMAIL_CHUNK_SIZE)
+    )
+    digests = (
+        (user_id, email, [name for _, _, name in group])
+        for (user_id, email), group in groupby(rows, key=lambda row: row[:2])
+    )
+
+    from_email = getattr(settings, "DEFAULT_FROM_EMAIL", None) or "noreply@example.com"
+    sent = 0
+    with get_connection(fail_silently=False) as connection:
+        for chunk in chunked(digests, settings.COURSE_EMAIL_CHUNK_SIZE):
+            messages = [
+                EmailMessage(
+                    subject='Обновления ваших курсов',
+                    body='Обновились курсы:\n' + '\n'.join(f'— {name}' for name in names),
+                    from_email=from_email,
+                    to=[email],
+                )
+                for _, email, names in chunk
+            ]
+            sent += connection.send_messages(messages)
+            User.objects.filter(pk__in=[user_id for user_id, _, _ in chunk]).update(last_digest_sent_at=run_at)
+    event('emails_sent', sent)
+    return sent
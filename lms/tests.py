@@ -1,12 +1,40 @@
+import io
+import threading
+from decimal import Decimal
+from unittest import mock
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.management import call_command
+from django.core.cache import cache
 from django.contrib.auth.models import Group
-from django.test import override_settings
-from rest_framework.test import APITestCase
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.http import http_date
+from django.utils.timezone import now
+from rest_framework.test import APIClient, APITestCase
 from rest_framework import status
 from django.core.exceptions import FieldDoesNotExist
 from django.db import models as djm
 
+from config import benchmarks
+from config.db_router import (
+    PIN_COOKIE, PrimaryReplicaRouter, ReplicaRoutingMiddleware, identify, pin_key, replica_reads,
+)
+from config.instrumentation import QueryRecorder
+from config.metrics import registry
+from config.task_metrics import slow_tasks
 from lms.models import Course, Lesson, Subscription
+from lms.cache import cache_stats, cached_payloads
+from lms.roles import is_moderator, reset_roles
+from lms.tasks import (
+    debounce_key, email_course_updated, notify_course_updated, send_course_digest, send_course_update_chunk,
+)
+from users.stripe_checkout import price_cache_key
 
 
 def unpack_list(resp):
@@ -169,3 +197,586 @@ class SubscriptionTests(BaseAPITestCase):
         r_course2 = self.client.get(self.course_detail(self.course.id))
         self.assertEqual(r_course2.status_code, status.HTTP_200_OK, r_course2.data)
         self.assertTrue(r_course2.data.get("is_subscribed") is False)
+
+
+class SubscriptionToggleQueryTests(BaseAPITestCase):
+    def test_toggle_is_one_query(self):
+        self.as_owner()
+        for expected in (status.HTTP_201_CREATED, status.HTTP_200_OK):
+            with CaptureQueriesContext(connection) as ctx:
+                r = self.client.post(reverse("subscription-toggle"), {"course_id": self.course.id}, format="json")
+            self.assertEqual(r.status_code, expected, r.data)
+            self.assertEqual(len(ctx.captured_queries), 1)
+
+    def test_toggle_unknown_course(self):
+        self.as_owner()
+        r = self.client.post(reverse("subscription-toggle"), {"course_id": 10 ** 6}, format="json")
+        self.assertEqual(r.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(Subscription.objects.exists())
+
+    def test_toggle_refreshes_cached_subscriptions(self):
+        self.as_owner()
+        url = reverse("course-detail", args=[self.course.id])
+        self.client.get(url)
+        self.client.post(reverse("subscription-toggle"), {"course_id": self.course.id}, format="json")
+        r = self.client.get(url)
+        self.assertIs(r.data["is_subscribed"], True)
+
+    @mock.patch("config.db_router.replica_configured", return_value=True)
+    def test_toggle_pins_user_to_primary(self, _):
+        self.as_owner()
+        r = self.client.post(reverse("subscription-toggle"), {"course_id": self.course.id}, format="json")
+        self.assertIn(PIN_COOKIE, r.cookies)
+        self.assertTrue(cache.get(pin_key(self.owner.id)))
+
+
+class SubscriptionToggleConcurrencyTests(TransactionTestCase):
+    def test_concurrent_toggles_never_duplicate(self):
+        user = get_user_model().objects.create(email="race@test.com")
+        course = Course.objects.create(name="Race")
+        threads_count, rounds = 8, 5
+        barrier = threading.Barrier(threads_count)
+        errors = []
+
+        def worker():
+            client = APIClient()
+            client.force_authenticate(user=user)
+            try:
+                for _ in range(rounds):
+                    barrier.wait()
+                    r = client.post(reverse("subscription-toggle"), {"course_id": course.id}, format="json")
+                    if r.status_code not in (status.HTTP_200_OK, status.HTTP_201_CREATED):
+                        errors.append(r.status_code)
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(threads_count)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errors, [])
+        self.assertLessEqual(Subscription.objects.filter(user=user, course=course).count(), 1)
+
+
+class BulkEndpointsTests(BaseAPITestCase):
+    def test_bulk_lessons_created_in_constant_queries(self):
+        self.as_owner()
+        course2 = Course.objects.create(name="Course 2", owner=self.owner)
+
+        def post(n):
+            items = [
+                {"name": f"B{i}", "description": "d", "course": (self.course, course2)[i % 2].id} for i in range(n)
+            ]
+            reset_roles(self.owner)
+            with CaptureQueriesContext(connection) as ctx:
+                r = self.client.post(reverse("lesson-bulk"), items, format="json")
+            self.assertEqual(r.status_code, status.HTTP_201_CREATED, r.data)
+            self.assertEqual(len(r.data), n)
+            return len(ctx.captured_queries)
+
+        self.assertEqual(post(2), post(30))
+        self.assertEqual(Lesson.objects.filter(name__startswith="B").count(), 32)
+        self.assertTrue(Lesson.objects.filter(name="B0", owner=self.owner).exists())
+
+    def test_bulk_lessons_report_errors_per_item(self):
+        self.as_owner()
+        items = [
+            {"name": "ok", "description": "d", "course": self.course.id},
+            {"name": "bad url", "description": "d", "course": self.course.id, "video_url": "https://example.com/v"},
+            {"name": "no course", "description": "d", "course": 10 ** 6},
+        ]
+        r = self.client.post(reverse("lesson-bulk"), items, format="json")
+        self.assertEqual(r.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertNotIn(0, r.data)
+        self.assertIn("video_url", r.data[1])
+        self.assertIn("course", r.data[2])
+        self.assertFalse(Lesson.objects.filter(name="ok").exists())
+
+    def test_bulk_subscriptions_results(self):
+        admin = get_user_model().objects.create(email="admin@test.com", is_staff=True)
+        Subscription.objects.create(user=self.other, course=self.course)
+        self.client.force_authenticate(user=admin)
+        items = [
+            {"user_id": self.owner.id, "course_id": self.course.id},
+            {"user_id": self.other.id, "course_id": self.course.id},
+            {"user_id": self.owner.id, "course_id": self.course.id},
+            {"user_id": self.owner.id, "course_id": 10 ** 6},
+        ]
+        r = self.client.post(reverse("subscription-bulk"), items, format="json")
+        self.assertEqual(r.status_code, status.HTTP_201_CREATED, r.data)
+        self.assertEqual([item["status"] for item in r.data], ["created", "exists", "exists", "error"])
+        self.assertEqual(Subscription.objects.filter(course=self.course).count(), 2)
+
+    def test_bulk_subscriptions_for_others_requires_staff(self):
+        self.as_owner()
+        r = self.client.post(
+            reverse("subscription-bulk"), [{"user_id": self.other.id, "course_id": self.course.id}], format="json"
+        )
+        self.assertEqual(r.status_code, status.HTTP_403_FORBIDDEN)
+        r = self.client.post(reverse("subscription-bulk"), [{"course_id": self.course.id}], format="json")
+        self.assertEqual(r.status_code, status.HTTP_201_CREATED)
+
+
+class CourseListQueryCountTests(BaseAPITestCase):
+    def _make_courses(self, n):
+        for i in range(n):
+            course = Course.objects.create(name=f"Bulk {i}", owner=self.owner)
+            Lesson.objects.create(name=f"BL{i}", course=course, owner=self.owner)
+            if i % 2:
+                Subscription.objects.create(user=self.owner, course=course)
+
+    def _count_list_queries(self, page_size):
+        # force_authenticate переиспользует один объект пользователя между запросами;
+        # кеш тоже сбрасываем, чтобы сравнивать два «холодных» запроса
+        reset_roles(self.owner)
+        cache.clear()
+        self.as_owner()
+        with CaptureQueriesContext(connection) as ctx:
+            r = self.client.get(reverse("course-list"), {"page_size": page_size})
+        self.assertEqual(r.status_code, status.HTTP_200_OK, r.data)
+        self.assertEqual(len(unpack_list(r)), page_size)
+        return len(ctx.captured_queries)
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        self._make_courses(20)
+        self.assertEqual(self._count_list_queries(2), self._count_list_queries(20))
+
+    def test_list_annotations_match_data(self):
+        Subscription.objects.create(user=self.owner, course=self.course)
+        self.as_owner()
+        r = self.client.get(reverse("course-list"))
+        item = next(c for c in unpack_list(r) if c["id"] == self.course.id)
+        self.assertEqual(item["lessons_count"], 2)
+        self.assertIs(item["is_subscribed"], True)
+
+
+class RoleResolutionTests(BaseAPITestCase):
+    def test_moderator_update_resolves_group_once(self):
+        self.as_moder()
+        with CaptureQueriesContext(connection) as ctx:
+            r = self.client.patch(reverse("lesson-detail", args=[self.lesson_other.id]),
+                                  {"name": "L2-once"}, format="json")
+        self.assertEqual(r.status_code, status.HTTP_200_OK, r.data)
+        group_queries = [q for q in ctx.captured_queries if '"auth_group"' in q["sql"]]
+        self.assertEqual(len(group_queries), 1)
+
+    def test_groups_change_resets_memoized_role(self):
+        self.assertFalse(is_moderator(self.other))
+        self.other.groups.add(self.group_moderators)
+        self.assertTrue(is_moderator(self.other))
+        self.other.groups.remove(self.group_moderators)
+        self.assertFalse(is_moderator(self.other))
+
+
+class PaginationModeTests(BaseAPITestCase):
+    def setUp(self):
+        super().setUp()
+        for i in range(5):
+            Course.objects.create(name=f"Page {i}", owner=self.owner)
+        self.as_owner()
+
+    def test_cursor_mode_walks_all_courses(self):
+        seen = []
+        url = reverse("course-list") + "?pagination=cursor&page_size=2"
+        while url:
+            r = self.client.get(url)
+            self.assertEqual(r.status_code, status.HTTP_200_OK, r.data)
+            self.assertNotIn("count", r.data)
+            seen += [c["id"] for c in r.data["results"]]
+            url = r.data["next"]
+        expected = list(Course.objects.filter(owner=self.owner).order_by("name", "id").values_list("id", flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_cursor_mode_rejects_other_ordering(self):
+        r = self.client.get(reverse("course-list"), {"pagination": "cursor", "q": "Page"})
+        self.assertEqual(r.status_code, status.HTTP_400_BAD_REQUEST)
+        r = self.client.get(reverse("payment-list"), {"pagination": "cursor", "ordering": "amount"})
+        self.assertEqual(r.status_code, status.HTTP_400_BAD_REQUEST)
+        r = self.client.get(reverse("payment-list"), {"pagination": "cursor", "ordering": "-paid_at"})
+        self.assertEqual(r.status_code, status.HTTP_200_OK)
+
+    def test_page_mode_without_count(self):
+        with CaptureQueriesContext(connection) as ctx:
+            r = self.client.get(reverse("course-list"), {"page_size": 4, "count": "false"})
+        self.assertEqual(r.status_code, status.HTTP_200_OK, r.data)
+        self.assertIsNone(r.data["count"])
+        self.assertEqual(len(r.data["results"]), 4)
+        self.assertIsNotNone(r.data["next"])
+        self.assertFalse(any("COUNT(*)" in q["sql"] for q in ctx.captured_queries))
+
+        r2 = self.client.get(r.data["next"])
+        self.assertEqual(len(r2.data["results"]), 2)
+        self.assertIsNone(r2.data["next"])
+
+
+class CourseUpdateEmailTests(BaseAPITestCase):
+    def setUp(self):
+        super().setUp()
+        User = get_user_model()
+        for i in range(5):
+            Subscription.objects.create(user=User.objects.create(email=f"sub{i}@test.com"), course=self.course)
+
+    @override_settings(COURSE_EMAIL_CHUNK_SIZE=2)
+    def test_recipients_are_sent_in_chunks(self):
+        with mock.patch.object(send_course_update_chunk, "delay") as delay:
+            self.assertEqual(email_course_updated(self.course.id), 3)
+        self.assertEqual([len(c.args[1]) for c in delay.call_args_list], [2, 2, 1])
+
+        for c in delay.call_args_list:
+            send_course_update_chunk(*c.args)
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertTrue(all(len(m.to) == 1 for m in mail.outbox))
+
+    def test_second_call_inside_window_is_noop(self):
+        with mock.patch.object(send_course_update_chunk, "delay") as delay:
+            email_course_updated(self.course.id)
+            self.assertEqual(email_course_updated(self.course.id), 0)
+        self.assertEqual(delay.call_count, 1)
+
+    def test_repeated_updates_schedule_one_notification(self):
+        cache.delete(debounce_key(self.course.id))
+        self.as_owner()
+        with mock.patch.object(email_course_updated, "apply_async") as apply_async:
+            for i in range(5):
+                r = self.client.patch(reverse("course-detail", args=[self.course.id]),
+                                      {"name": f"Course {i}"}, format="json")
+                self.assertEqual(r.status_code, status.HTTP_200_OK, r.data)
+        apply_async.assert_called_once()
+
+        args, kwargs = apply_async.call_args.args
+        with mock.patch.object(send_course_update_chunk, "delay"):
+            email_course_updated(*args, **kwargs)
+        with mock.patch.object(email_course_updated, "apply_async") as apply_async:
+            self.assertTrue(notify_course_updated(self.course.id))
+
+
+class TaskMetricsTests(CourseUpdateEmailTests):
+    def counter(self, name, **labels):
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        return registry.snapshot()["counters"].get(key, 0)
+
+    @override_settings(COURSE_EMAIL_CHUNK_SIZE=2, CELERY_SLOW_TASK_SECONDS=0)
+    def test_course_update_task_counters(self):
+        task = email_course_updated.name
+        runs = self.counter("celery_tasks_total", task=task, state="SUCCESS")
+        recipients = self.counter("celery_task_events_total", task=task, event="recipients")
+        skipped = self.counter("celery_task_events_total", task=task, event="skipped_notification_window")
+
+        with mock.patch.object(send_course_update_chunk, "delay"):
+            email_course_updated.apply((self.course.id,))
+            email_course_updated.apply((self.course.id,))
+
+        self.assertEqual(self.counter("celery_tasks_total", task=task, state="SUCCESS") - runs, 2)
+        self.assertEqual(self.counter("celery_task_events_total", task=task, event="recipients") - recipients, 5)
+        self.assertEqual(
+            self.counter("celery_task_events_total", task=task, event="skipped_notification_window") - skipped, 1
+        )
+        self.assertEqual(slow_tasks()[-1]["task"], task)
+
+        registry.flush()
+        out = io.StringIO()
+        call_command("celery_task_stats", stdout=out)
+        self.assertIn(task, out.getvalue())
+        self.assertIn("skipped_notification_window", out.getvalue())
+
+
+class CourseDigestTests(BaseAPITestCase):
+    def setUp(self):
+        super().setUp()
+        User = get_user_model()
+        self.reader = User.objects.create(email="digest@test.com",
+                                          course_notifications=User.NotificationMode.DIGEST)
+        self.course2 = Course.objects.create(name="Course 2", owner=self.owner)
+        Subscription.objects.create(user=self.reader, course=self.course)
+        Subscription.objects.create(user=self.reader, course=self.course2)
+        Subscription.objects.create(user=self.other, course=self.course)
+
+    def test_digest_groups_courses_per_user(self):
+        self.assertEqual(send_course_digest(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ["digest@test.com"])
+        self.assertIn("Course 1", mail.outbox[0].body)
+        self.assertIn("Course 2", mail.outbox[0].body)
+
+        self.assertEqual(send_course_digest(), 0)
+        self.course2.save()
+        send_course_digest()
+        self.assertNotIn("Course 1", mail.outbox[-1].body)
+
+    def test_digest_users_skip_instant_emails(self):
+        with mock.patch.object(send_course_update_chunk, "delay") as delay:
+            email_course_updated(self.course.id)
+        self.assertEqual(delay.call_args.args[1], ["other@test.com"])
+
+
+class CourseCacheTests(BaseAPITestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def get_course(self, user):
+        self.client.force_authenticate(user=user)
+        return self.client.get(reverse("course-detail", args=[self.course.id]))
+
+    def test_second_read_is_served_from_cache(self):
+        self.get_course(self.owner)
+        with CaptureQueriesContext(connection) as ctx:
+            r = self.get_course(self.owner)
+        self.assertEqual(r.data["lessons_count"], 2)
+        self.assertFalse(any('"lms_lesson"."video_url"' in q["sql"] for q in ctx.captured_queries))
+        self.assertGreater(cache_stats()["hits"], 0)
+
+    def test_lesson_edit_invalidates_course_body(self):
+        self.get_course(self.owner)
+        self.lesson_owner.name = "L1-renamed"
+        self.lesson_owner.save()
+        names = {lesson["name"] for lesson in self.get_course(self.owner).data["lessons"]}
+        self.assertIn("L1-renamed", names)
+
+    def test_is_subscribed_is_per_user_overlay(self):
+        Subscription.objects.create(user=self.moder, course=self.course)
+        self.assertIs(self.get_course(self.owner).data["is_subscribed"], False)
+        self.assertIs(self.get_course(self.moder).data["is_subscribed"], True)
+        Subscription.objects.filter(user=self.moder).delete()
+        self.assertIs(self.get_course(self.moder).data["is_subscribed"], False)
+
+
+class ConditionalGetTests(BaseAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.as_owner()
+
+    def assert_revalidates(self, url, touch, last_modified=False):
+        r = self.client.get(url)
+        self.assertEqual(r.status_code, status.HTTP_200_OK, r.data)
+        etag = r["ETag"]
+        self.assertEqual(r.has_header("Last-Modified"), last_modified)
+
+        with CaptureQueriesContext(connection) as ctx:
+            r304 = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(r304.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertFalse(any('"lms_lesson"."video_url"' in q["sql"] for q in ctx.captured_queries))
+
+        touch()
+        r2 = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(r2.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(r2["ETag"], etag)
+
+    def test_course_detail_changes_with_lesson_edit(self):
+        def touch():
+            self.lesson_owner.name = "L1-new"
+            self.lesson_owner.save()
+        self.assert_revalidates(reverse("course-detail", args=[self.course.id]), touch)
+
+    def test_course_list_changes_with_subscription(self):
+        def touch():
+            Subscription.objects.create(user=self.owner, course=self.course)
+        self.assert_revalidates(reverse("course-list"), touch)
+
+    def test_lesson_detail(self):
+        def touch():
+            self.lesson_owner.description = "changed"
+            self.lesson_owner.save()
+        self.assert_revalidates(reverse("lesson-detail", args=[self.lesson_owner.id]), touch, last_modified=True)
+
+    def test_lesson_list_changes_with_delete(self):
+        self.assert_revalidates(reverse("lesson-list"), self.lesson_owner.delete)
+
+    def test_if_modified_since_after_delete(self):
+        # клиент помнит время позже любого updated_at; удаляется не самый свежий урок
+        since = http_date(now().timestamp() + 60)
+        self.as_moder()
+        urls = (reverse("course-list"), reverse("lesson-list"), reverse("course-detail", args=[self.course.id]))
+        for url in urls:
+            self.assertFalse(self.client.get(url).has_header("Last-Modified"))
+        self.lesson_owner.delete()
+        for url in urls:
+            r = self.client.get(url, HTTP_IF_MODIFIED_SINCE=since)
+            self.assertEqual(r.status_code, status.HTTP_200_OK, url)
+
+
+class CourseListRepresentationTests(BaseAPITestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.as_owner()
+
+    def first_item(self, **params):
+        r = self.client.get(reverse("course-list"), params)
+        self.assertEqual(r.status_code, status.HTTP_200_OK, r.data)
+        return unpack_list(r)[0]
+
+    def test_list_is_compact_by_default(self):
+        item = self.first_item()
+        self.assertNotIn("lessons", item)
+        self.assertEqual(item["lessons_count"], 2)
+
+    def test_expand_lessons(self):
+        self.first_item()
+        item = self.first_item(expand="lessons")
+        self.assertEqual(len(item["lessons"]), 2)
+
+    def test_sparse_fields_narrow_sql(self):
+        with CaptureQueriesContext(connection) as ctx:
+            item = self.first_item(fields="id,name,lessons_count")
+        self.assertEqual(set(item), {"id", "name", "lessons_count"})
+        self.assertFalse(any('"lms_course"."description"' in q["sql"] for q in ctx.captured_queries))
+
+    def test_sparse_fields_with_expanded_lessons(self):
+        item = self.first_item(expand="lessons", fields="id,name,lessons")
+        self.assertEqual(set(item), {"id", "name", "lessons"})
+        self.assertEqual(len(item["lessons"]), 2)
+        self.assertNotIn("lessons", self.first_item(fields="id,lessons"))
+
+
+class SearchTests(BaseAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.as_owner()
+        self.python = Course.objects.create(name="Основы программирования", description="Первый курс", owner=self.owner)
+        Lesson.objects.create(name="Декораторы", description="Функции высшего порядка", course=self.python,
+                              owner=self.owner)
+        self.cooking = Course.objects.create(name="Кулинария", description="Готовим ужин после программирования",
+                                             owner=self.owner)
+
+    def search(self, url_name, q):
+        r = self.client.get(reverse(url_name), {"q": q})
+        self.assertEqual(r.status_code, status.HTTP_200_OK, r.data)
+        return [item["id"] for item in unpack_list(r)]
+
+    def test_course_match_ranks_above_weaker_match(self):
+        self.assertEqual(self.search("course-list", "программирование"), [self.python.id, self.cooking.id])
+
+    def test_lesson_match_rolls_up_to_course(self):
+        self.assertEqual(self.search("course-list", "декоратор"), [self.python.id])
+
+    def test_lesson_search(self):
+        lesson_id = Lesson.objects.get(name="Декораторы").id
+        self.assertEqual(self.search("lesson-list", "функция"), [lesson_id])
+
+
+class BenchmarkBudgetTests(BaseAPITestCase):
+    def test_query_budgets_hold_with_cold_cache(self):
+        staff = get_user_model().objects.create(email="bench@test.com", is_staff=True)
+        for i in range(10):
+            course = Course.objects.create(name=f"Bench {i}", owner=self.owner)
+            Lesson.objects.create(name=f"BL{i}", course=course, owner=self.owner)
+        cache.set("sentinel", 1)
+        results = benchmarks.run(staff, iterations=2, warmup=0, cold_cache=True)
+        self.assertEqual(set(results), set(benchmarks.BUDGETS))
+        # общий кеш не очищается, а цены заглушки Stripe в него не попадают
+        self.assertEqual(cache.get("sentinel"), 1)
+        currency = getattr(settings, "STRIPE_CURRENCY", "rub")
+        self.assertIsNone(cache.get(price_cache_key(self.course.id, Decimal("990.00"), currency)))
+        query_budgets = {name: {"queries": b["queries"]} for name, b in benchmarks.BUDGETS.items()}
+        self.assertEqual(benchmarks.check_budgets(results, query_budgets), [])
+
+
+class InstrumentationTests(BaseAPITestCase):
+    @override_settings(METRICS_SAMPLE_RATE=1.0, METRICS_SERVER_TIMING=True, METRICS_TOKEN="secret")
+    def test_server_timing_and_metrics_endpoint(self):
+        self.as_owner()
+        r = self.client.get(reverse("course-list"))
+        self.assertIn('db;dur=', r["Server-Timing"])
+        self.assertIn("serialize;dur=", r["Server-Timing"])
+        self.assertIn("render;dur=", r["Server-Timing"])
+
+        self.assertEqual(self.client.get(reverse("metrics")).status_code, 401)
+        r = self.client.get(reverse("metrics"), HTTP_AUTHORIZATION="Bearer secret")
+        self.assertEqual(r.status_code, status.HTTP_200_OK)
+        body = r.content.decode()
+        self.assertIn("# TYPE http_request_duration_seconds histogram", body)
+        self.assertIn('db_queries_total{view="', body)
+        self.assertIn('http_serialize_seconds_total{view="', body)
+
+    @override_settings(METRICS_SAMPLE_RATE=0.0, METRICS_SERVER_TIMING=True)
+    def test_unsampled_request_has_no_server_timing(self):
+        self.as_owner()
+        r = self.client.get(reverse("course-list"))
+        self.assertFalse(r.has_header("Server-Timing"))
+
+    def test_recorder_groups_in_lists_of_any_length(self):
+        recorder = QueryRecorder()
+        with recorder.record():
+            for ids in ([1], [1, 2], [1, 2, 3]):
+                list(Course.objects.filter(pk__in=ids))
+            list(Lesson.objects.all())
+        self.assertEqual(recorder.count, 4)
+        [(sql, n)] = recorder.duplicates(3)
+        self.assertEqual(n, 3)
+        self.assertIn("IN (...)", sql)
+
+
+@mock.patch("config.db_router.replica_configured", return_value=True)
+class ReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.router = PrimaryReplicaRouter()
+        self.factory = RequestFactory()
+
+    def call(self, request, user_id=None, write=False, view=None):
+        seen = {}
+
+        def get_response(request):
+            if view is not None:
+                middleware.process_view(request, view, (), {})
+            if user_id is not None:
+                identify(user_id)
+            if write:
+                self.router.db_for_write(Course)
+            seen["db"] = self.router.db_for_read(Course)
+            request.user = mock.Mock(id=user_id or 1, is_authenticated=True)
+            return HttpResponse()
+
+        middleware = ReplicaRoutingMiddleware(get_response)
+        return middleware(request), seen["db"]
+
+    def test_outside_request_reads_primary_unless_opted_in(self, _):
+        self.assertEqual(self.router.db_for_read(Course), "default")
+        with replica_reads():
+            self.assertEqual(self.router.db_for_read(Course), "replica")
+            with replica_reads(False):
+                self.assertEqual(self.router.db_for_read(Course), "default")
+
+    def test_reads_in_atomic_block_or_after_write_stay_on_primary(self, _):
+        with replica_reads():
+            with mock.patch.object(connection, "in_atomic_block", True):
+                self.assertEqual(self.router.db_for_read(Course), "default")
+            self.router.db_for_write(Course)
+            self.assertEqual(self.router.db_for_read(Course), "default")
+
+    def test_user_reads_primary_after_own_write(self, _):
+        _, db = self.call(self.factory.get("/"), user_id=7)
+        self.assertEqual(db, "replica")
+        response, db = self.call(self.factory.post("/"), user_id=7, write=True)
+        self.assertEqual(db, "default")
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+        _, db = self.call(self.factory.get("/"), user_id=7)
+        self.assertEqual(db, "default")
+        _, db = self.call(self.factory.get("/"), user_id=8)
+        self.assertEqual(db, "replica")
+
+        self.factory.cookies[PIN_COOKIE] = "1"
+        _, db = self.call(self.factory.get("/"))
+        self.assertEqual(db, "default")
+
+    def test_view_can_opt_out(self, _):
+        from users.views import PaymentStatusView
+
+        _, db = self.call(self.factory.get("/"), view=PaymentStatusView.as_view())
+        self.assertEqual(db, "default")
+
+    def test_cache_fills_read_primary(self, _):
+        router = self.router
+
+        def build(pks):
+            return {pk: {"db": router.db_for_read(Course)} for pk in pks}
+
+        with replica_reads():
+            [payload] = cached_payloads("course", [1], build)
+        self.assertEqual(payload["db"], "default")
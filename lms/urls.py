@@ -1,6 +1,9 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import CourseViewSet, LessonListCreateView, LessonDetailView, SubscriptionToggleView
+from .views import (
+    CourseViewSet, LessonBulkCreateView, LessonListCreateView, LessonDetailView, SubscriptionBulkView,
+    SubscriptionToggleView,
+)
 
 router = DefaultRouter()
 router.register(r'courses', CourseViewSet, basename='course')
@@ -8,6 +11,8 @@ router.register(r'courses', CourseViewSet, basename='course')
 urlpatterns = [
     path('', include(router.urls)),
     path('lessons/', LessonListCreateView.as_view(), name='lesson-list'),
+    path('lessons/bulk/', LessonBulkCreateView.as_view(), name='lesson-bulk'),
     path('lessons/<int:pk>/', LessonDetailView.as_view(), name='lesson-detail'),
     path("subscriptions/toggle/", SubscriptionToggleView.as_view(), name="subscription-toggle"),
+    path("subscriptions/bulk/", SubscriptionBulkView.as_view(), name="subscription-bulk"),
 ]
@@ -1,19 +1,102 @@
 from rest_framework import viewsets, generics, permissions, status
+from rest_framework.exceptions import PermissionDenied, ValidationError
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from django.shortcuts import get_object_or_404
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchRank
+from django.db.models import Count, F, Max
+from django.http import Http404
 
-from .models import Course, Lesson, Subscription
+from config.instrumentation import serialization
+from .cache import bump, cached_payloads, forget_subscriptions, subscribed_course_ids
+from .conditional import make_validators, not_modified, set_validators
+from .models import Course, Lesson, Subscription, search_query
 from .pagination import MyPagination
-from .serializers import CourseSerializer, LessonSerializer
+from .serializers import CourseListSerializer, CourseSerializer, LessonSerializer, SubscriptionItemSerializer
 from .permissions import IsOwner, ModerOrOwner, NotModer
-from .tasks import email_course_updated
+from .roles import sees_all
+from .tasks import notify_course_updated
 
-class CourseViewSet(viewsets.ModelViewSet):
+
+class CachedReadMixin:
+    """
+    list/retrieve берут сериализованные тела объектов из lms.cache: запрос к БД выбирает
+    только видимые пользователю id, а сериализуются лишь промахи кеша: их выбирает
+    get_payload_queryset() (по умолчанию payload_queryset) и сериализует get_serializer().
+    Если view задаёт list_validators/object_validators, ответы получают ETag (и Last-Modified, если он задан),
+    а условные запросы с актуальной копией получают 304 ещё до сериализации.
+    """
+    cache_kind = None
+    payload_queryset = None
+
+    def get_payload_queryset(self):
+        return self.payload_queryset.all()
+
+    def build_payloads(self, pks) -> dict:
+        with serialization():
+            data = self.get_serializer(self.get_payload_queryset().filter(pk__in=pks), many=True).data
+        return {item['id']: dict(item) for item in data}
+
+    def overlay(self, payloads):
+        """Персональные поля поверх общего для всех пользователей тела."""
+        return payloads
+
+    def cache_variant(self) -> str:
+        """Разные представления одного объекта кешируются под разными ключами."""
+        return ''
+
+    def cached_data(self, objs):
+        namespace = f'{self.request.scheme}://{self.request.get_host()}:{self.cache_variant()}'
+        payloads = cached_payloads(self.cache_kind, [obj.pk for obj in objs], self.build_payloads, namespace)
+        return self.overlay(payloads)
+
+    def list_data(self, objs):
+        return self.cached_data(objs)
+
+    def list_validators(self, queryset):
+        return None
+
+    def object_validators(self, obj):
+        return None
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        validators = self.list_validators(queryset)
+        if validators and (response := not_modified(request._request, validators)):
+            return response
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            response = self.get_paginated_response(self.list_data(page))
+        else:
+            response = Response(self.list_data(queryset))
+        return set_validators(response, validators) if validators else response
+
+    def retrieve(self, request, *args, **kwargs):
+        obj = self.get_object()
+        validators = self.object_validators(obj)
+        if validators and (response := not_modified(request._request, validators)):
+            return response
+
+        response = Response(self.cached_data([obj])[0])
+        return set_validators(response, validators) if validators else response
+
+
+class CourseViewSet(CachedReadMixin, viewsets.ModelViewSet):
+    """
+    Список по умолчанию отдаёт компактный CourseListSerializer без уроков;
+    ?expand=lessons возвращает полное представление, ?fields=id,name,... — только
+    перечисленные поля, и тогда SQL тоже сужается через .only().
+    ?q=... — полнотекстовый поиск по курсам и их урокам с сортировкой по рангу.
+    """
     queryset = Course.objects.all().prefetch_related('lessons')
     serializer_class = CourseSerializer
     pagination_class = MyPagination
+    cursor_ordering = ('name', 'id')
+    cache_kind = 'course'
+    payload_queryset = Course.objects.defer('search_vector')
 
     def get_permissions(self):
         a = self.action
@@ -25,18 +108,93 @@ class CourseViewSet(viewsets.ModelViewSet):
             return [permissions.IsAuthenticated(), NotModer(), IsOwner()]
         return [permissions.IsAuthenticated()]
 
+    def expand_lessons(self):
+        return 'lessons' in self.request.query_params.get('expand', '').split(',')
+
+    def sparse_fields(self):
+        """Поля из ?fields= для списка (None — параметр не передан); lessons — только вместе с ?expand=lessons."""
+        if self.action != 'list' or 'fields' not in self.request.query_params:
+            return None
+        allowed = set(self.get_serializer_class()().fields)
+        return [f for f in self.request.query_params['fields'].split(',') if f in allowed] or ['id']
+
+    def get_serializer_class(self):
+        if self.action == 'list' and not self.expand_lessons():
+            return CourseListSerializer
+        return CourseSerializer
+
     def get_queryset(self):
         u = self.request.user
-        if u.is_staff or u.groups.filter(name='moderators').exists():
-            return Course.objects.all()
-        return Course.objects.filter(owner=u)
+        qs = Course.objects.all() if sees_all(u) else Course.objects.filter(owner_id=u.id)
+        if self.action == 'list' and self.request.query_params.get('q'):
+            qs = qs.search(self.request.query_params['q'])
+        fields = self.sparse_fields()
+        if fields is not None:
+            concrete = {name for f in Course._meta.concrete_fields for name in (f.attname, f.name)}
+            qs = qs.only('id', 'name', *(f for f in fields if f in concrete))
+            if {'lessons_count', 'is_subscribed'} & set(fields):
+                qs = qs.with_stats(u)
+            if 'lessons' in fields:
+                qs = qs.prefetch_related('lessons')
+            return self.ordered(qs)
+        if self.action in ('list', 'retrieve'):
+            return self.ordered(qs.only('id', 'name', 'updated_at'))
+        return qs.with_stats(u).prefetch_related('lessons').order_by('name', 'id')
+
+    @staticmethod
+    def ordered(qs):
+        """Результаты поиска уже отсортированы по рангу."""
+        return qs if qs.query.order_by else qs.order_by('name', 'id')
+
+    def cache_variant(self):
+        return 'full' if self.get_serializer_class() is CourseSerializer else 'compact'
+
+    def get_payload_queryset(self):
+        courses = super().get_payload_queryset().with_stats()
+        if self.get_serializer_class() is CourseSerializer:
+            courses = courses.prefetch_related('lessons')
+        return courses
+
+    def list_data(self, objs):
+        fields = self.sparse_fields()
+        if fields is None:
+            return self.cached_data(objs)
+        with serialization():
+            return self.get_serializer(objs, many=True, fields=fields).data
+
+    def overlay(self, payloads):
+        subscribed = subscribed_course_ids(self.request.user)
+        for item in payloads:
+            item['is_subscribed'] = item['id'] in subscribed
+        return payloads
+
+    def list_validators(self, queryset):
+        courses = queryset.order_by().aggregate(n=Count('id'), changed=Max('updated_at'))
+        lessons = Lesson.objects.filter(course__in=queryset.order_by().values('id')).aggregate(
+            n=Count('id'), changed=Max('updated_at')
+        )
+        subscribed = sorted(subscribed_course_ids(self.request.user))
+        # только ETag: удаление не самого свежего курса или урока и подписка не сдвигают
+        # max(updated_at), и If-Modified-Since получил бы ложный 304
+        return make_validators(
+            self.request.user.id, self.request.get_full_path(),
+            courses['n'], courses['changed'], lessons['n'], lessons['changed'], subscribed,
+        )
+
+    def object_validators(self, obj):
+        lessons = obj.lessons.order_by().aggregate(n=Count('id'), changed=Max('updated_at'))
+        is_subscribed = obj.id in subscribed_course_ids(self.request.user)
+        # только ETag по той же причине: удаление урока и подписка не меняют updated_at
+        return make_validators(
+            self.request.user.id, obj.id, obj.updated_at, lessons['n'], lessons['changed'], is_subscribed,
+        )
 
     def perform_create(self, serializer):
         serializer.save(owner=self.request.user)
 
     def perform_update(self, serializer):
         updated_course = serializer.save()
-        email_course_updated.delay(updated_course.id)
+        notify_course_updated(updated_course.id)
 
 
 class SubscriptionToggleView(APIView):
@@ -47,35 +205,118 @@ class SubscriptionToggleView(APIView):
         course_id = request.data.get("course_id")
         if not course_id:
             return Response({"detail": "course_id is required"}, status=400)
+        try:
+            course_id = int(course_id)
+        except (TypeError, ValueError):
+            return Response({"detail": "course_id must be an integer"}, status=400)
 
-        course = get_object_or_404(Course, pk=course_id)
+        result = Subscription.objects.toggle(user.id, course_id)
+        if result is None:
+            raise Http404
+        # сырой SQL не вызывает сигналов Subscription
+        forget_subscriptions(user.id)
 
-        qs = Subscription.objects.filter(user=user, course=course)
-        if qs.exists():
-            qs.delete()
+        is_subscribed, created = result
+        if not is_subscribed:
             return Response(
-                {"message": "подписка удалена", "course_id": course.id, "is_subscribed": False},
+                {"message": "подписка удалена", "course_id": course_id, "is_subscribed": False},
                 status=status.HTTP_200_OK,
             )
-        else:
-            Subscription.objects.create(user=user, course=course)
-            return Response(
-                {"message": "подписка добавлена", "course_id": course.id, "is_subscribed": True},
-                status=status.HTTP_201_CREATED,
-            )
+        return Response(
+            {"message": "подписка добавлена", "course_id": course_id, "is_subscribed": True},
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+        )
+
+
+def bulk_items(request) -> list:
+    """Тело bulk-запроса: непустой список не длиннее LMS_BULK_MAX_ITEMS."""
+    items = request.data
+    if not isinstance(items, list) or not items:
+        raise ValidationError({"detail": "Ожидается непустой список элементов."})
+    if len(items) > settings.LMS_BULK_MAX_ITEMS:
+        raise ValidationError({"detail": f"Не больше {settings.LMS_BULK_MAX_ITEMS} элементов за запрос."})
+    return items
+
+
+class SubscriptionBulkView(APIView):
+    """
+    Пакетная подписка: [{"course_id": ..., "user_id": ...}, ...]. Подписывать других
+    пользователей может только staff. Курсы, пользователи и уже существующие подписки
+    проверяются тремя запросами на весь пакет, новые строки пишутся одним bulk_create
+    с ignore_conflicts. В ответе — результат для каждого элемента в исходном порядке.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        items = SubscriptionItemSerializer(data=bulk_items(request), many=True)
+        items.is_valid(raise_exception=True)
+        user = request.user
+        pairs = [(item.get('user_id', user.id), item['course_id']) for item in items.validated_data]
+
+        user_ids = {u for u, _ in pairs}
+        if user_ids - {user.id} and not user.is_staff:
+            raise PermissionDenied("Подписывать других пользователей может только администратор.")
+        course_ids = {c for _, c in pairs}
+        known_courses = set(Course.objects.filter(pk__in=course_ids).values_list('id', flat=True))
+        known_users = set(get_user_model().objects.filter(pk__in=user_ids).values_list('id', flat=True))
+        existing = set(
+            Subscription.objects.filter(user_id__in=user_ids, course_id__in=course_ids)
+            .values_list('user_id', 'course_id')
+        )
+
+        results, new = [], {}
+        for user_id, course_id in pairs:
+            result = {"user_id": user_id, "course_id": course_id}
+            if course_id not in known_courses:
+                result.update(status="error", detail="Курс не найден.")
+            elif user_id not in known_users:
+                result.update(status="error", detail="Пользователь не найден.")
+            elif (user_id, course_id) in existing or (user_id, course_id) in new:
+                result.update(status="exists")
+            else:
+                new[(user_id, course_id)] = Subscription(user_id=user_id, course_id=course_id)
+                result.update(status="created")
+            results.append(result)
 
+        Subscription.objects.bulk_create(new.values(), batch_size=1000, ignore_conflicts=True)
+        # bulk_create не вызывает сигналов Subscription
+        forget_subscriptions(*{user_id for user_id, _ in new})
+        return Response(results, status=status.HTTP_201_CREATED if new else status.HTTP_200_OK)
 
-class LessonListCreateView(generics.ListCreateAPIView):
+
+class LessonPayloadsMixin(CachedReadMixin):
+    cache_kind = 'lesson'
+    payload_queryset = Lesson.objects.defer('search_vector')
+
+    def list_validators(self, queryset):
+        lessons = queryset.order_by().aggregate(n=Count('id'), changed=Max('updated_at'))
+        # только ETag: удаление урока не сдвигает max(updated_at)
+        return make_validators(
+            self.request.user.id, self.request.get_full_path(), lessons['n'], lessons['changed'],
+        )
+
+    def object_validators(self, obj):
+        return make_validators(obj.id, obj.updated_at, last_modified=obj.updated_at)
+
+
+class LessonListCreateView(LessonPayloadsMixin, generics.ListCreateAPIView):
     queryset = Lesson.objects.all()
     serializer_class = LessonSerializer
     permission_classes = [permissions.IsAuthenticated]
     pagination_class = MyPagination
+    cursor_ordering = ('id',)
 
     def get_queryset(self):
         u = self.request.user
-        if u.is_staff or u.groups.filter(name='moderators').exists():
-            return Lesson.objects.all()
-        return Lesson.objects.filter(owner=u)
+        qs = Lesson.objects.all() if sees_all(u) else Lesson.objects.filter(owner_id=u.id)
+        if self.request.method == 'GET':
+            if self.request.query_params.get('q'):
+                query = search_query(self.request.query_params['q'])
+                qs = qs.filter(search_vector=query).annotate(
+                    rank=SearchRank(F('search_vector'), query)
+                ).order_by('-rank', 'id')
+            return qs.only('id', 'updated_at')
+        return qs
 
     def get_permissions(self):
         if self.request.method.lower() == 'post':
@@ -86,11 +327,44 @@ class LessonListCreateView(generics.ListCreateAPIView):
         serializer.save(owner=self.request.user)
 
 
-class LessonDetailView(generics.RetrieveUpdateDestroyAPIView):
+class LessonBulkCreateView(APIView):
+    """
+    Пакетное создание уроков: список объектов в формате LessonSerializer. Курсы для всего
+    пакета загружаются одним запросом, и пакет либо создаётся целиком одним bulk_create,
+    либо возвращает 400 с ошибками, сгруппированными по индексам невалидных элементов.
+    """
+    permission_classes = [permissions.IsAuthenticated, NotModer]
+
+    def post(self, request, *args, **kwargs):
+        items = bulk_items(request)
+        course_ids = {item.get('course') for item in items if isinstance(item, dict)}
+        courses = Course.objects.only('id').in_bulk(
+            [pk for pk in course_ids if isinstance(pk, int) or (isinstance(pk, str) and pk.isdigit())]
+        )
+        serializer = LessonSerializer(data=items, many=True, context={'request': request, 'courses': courses})
+        serializer.is_valid(raise_exception=True)
+
+        lessons = Lesson.objects.bulk_create(
+            [Lesson(**data, owner=request.user) for data in serializer.validated_data], batch_size=1000
+        )
+        # bulk_create не вызывает сигналов Lesson: сбрасываем кеш тел затронутых курсов
+        bump('course', *{lesson.course_id for lesson in lessons})
+        return Response(
+            LessonSerializer(lessons, many=True, context={'request': request}).data,
+            status=status.HTTP_201_CREATED,
+        )
+
+
+class LessonDetailView(LessonPayloadsMixin, generics.RetrieveUpdateDestroyAPIView):
     queryset = Lesson.objects.all()
     serializer_class = LessonSerializer
     permission_classes = [permissions.IsAuthenticated]
 
+    def get_queryset(self):
+        if self.request.method == 'GET':
+            return Lesson.objects.only('id', 'updated_at')
+        return Lesson.objects.all()
+
     def get_permissions(self):
         m = self.request.method.lower()
         if m in ['put', 'patch']:
@@ -0,0 +1,117 @@
+from datetime import date, datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Max, Q, Sum
+from django.db.models.functions import TruncDate, TruncDay, TruncMonth, TruncWeek
+from django.utils.timezone import get_current_timezone, now
+
+from .models import Payment, PaymentDailyRollup
+
+# Запас для транзакций, закоммиченных уже после начала прошлого пересчёта
+ROLLUP_LAG = timedelta(minutes=5)
+
+PERIODS = {
+    'day': TruncDay,
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+GROUP_FIELDS = {
+    'course': 'course_id',
+    'method': 'method',
+    'status': 'status',
+}
+
+
+def touched_days(since) -> list[date]:
+    """
+    Дни (по paid_at), в которых платежи создавались или менялись после since, плюс дни,
+    помеченные stale после удаления платежа (сигнал post_delete; QuerySet.update/raw SQL его не вызывают).
+    """
+    qs = Payment.objects.all()
+    if since is not None:
+        qs = qs.filter(updated_at__gt=since)
+    days = set(qs.annotate(day=TruncDate('paid_at')).order_by().values_list('day', flat=True).distinct())
+    days.update(PaymentDailyRollup.objects.filter(stale=True).values_list('day', flat=True).distinct())
+    return sorted(days)
+
+
+def day_ranges(days) -> Q:
+    """
+    Условие «paid_at попадает в один из дней» полуоткрытыми диапазонами в текущей зоне,
+    чтобы работал индекс по paid_at (TruncDate в WHERE его не использует). Подряд идущие
+    дни склеиваются в один диапазон.
+    """
+    tz = get_current_timezone()
+    ranges = []
+    for day in sorted(days):
+        if ranges and ranges[-1][1] == day:
+            ranges[-1][1] = day + timedelta(days=1)
+        else:
+            ranges.append([day, day + timedelta(days=1)])
+    condition = Q()
+    for start, end in ranges:
+        condition |= Q(
+            paid_at__gte=datetime.combine(start, time.min, tzinfo=tz),
+            paid_at__lt=datetime.combine(end, time.min, tzinfo=tz),
+        )
+    return condition
+
+
+def refresh_payment_rollup() -> dict:
+    """
+    Пересчитать PaymentDailyRollup только за дни, затронутые с прошлого запуска.
+    Отметка прошлого запуска — максимальный refreshed_at в самой сводке; пустая сводка
+    пересчитывается целиком.
+    """
+    started = now()
+    last = PaymentDailyRollup.objects.aggregate(last=Max('refreshed_at'))['last']
+    days = touched_days(last - ROLLUP_LAG if last else None)
+    if not days:
+        return {'days': 0, 'rows': 0}
+
+    buckets = (
+        Payment.objects
+        .filter(day_ranges(days))
+        .annotate(day=TruncDate('paid_at'))
+        .order_by()
+        .values('day', 'course_id', 'method', 'status')
+        .annotate(revenue=Sum('amount'), count=Count('id'))
+    )
+    rows = [
+        PaymentDailyRollup(
+            day=b['day'], course_id=b['course_id'], method=b['method'], status=b['status'],
+            revenue=b['revenue'], count=b['count'], refreshed_at=started,
+        )
+        for b in buckets
+    ]
+    with transaction.atomic():
+        PaymentDailyRollup.objects.filter(day__in=days).delete()
+        PaymentDailyRollup.objects.bulk_create(rows, batch_size=1000)
+    return {'days': len(days), 'rows': len(rows)}
+
+
+def payment_analytics(*, period='day', group_by=(), date_from=None, date_to=None, statuses=None,
+                      methods=None, course_id=None):
+    """Выручка, количество и средний чек из сводки, без обращения к таблице платежей."""
+    qs = PaymentDailyRollup.objects.all()
+    if date_from:
+        qs = qs.filter(day__gte=date_from)
+    if date_to:
+        qs = qs.filter(day__lte=date_to)
+    if statuses:
+        qs = qs.filter(status__in=statuses)
+    if methods:
+        qs = qs.filter(method__in=methods)
+    if course_id:
+        qs = qs.filter(course_id=course_id)
+
+    keys = [GROUP_FIELDS[g] for g in group_by]
+    return (
+        qs.annotate(period=PERIODS[period]('day'))
+        .values('period', *keys)
+        .annotate(revenue=Sum('revenue'), count=Sum('count'))
+        .annotate(average=ExpressionWrapper(
+            F('revenue') / F('count'), output_field=DecimalField(max_digits=14, decimal_places=2)
+        ))
+        .order_by('period', *keys)
+    )
@@ -0,0 +1,97 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils.functional import cached_property
+from django.utils.translation import gettext_lazy as _
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+
+from config.db_router import identify, primary_reads
+from lms.roles import remember_roles
+
+User = get_user_model()
+
+
+def token_state_key(user_id) -> str:
+    return f'users:token-state:{user_id}'
+
+
+def get_token_state(user_id) -> dict | None:
+    """
+    Актуальные token_version/is_active/is_staff пользователя из кеша с коротким TTL;
+    при промахе — один лёгкий запрос по первичному ключу. None — пользователя нет.
+    """
+    key = token_state_key(user_id)
+    state = cache.get(key)
+    if state is None:
+        # с primary: отставшая реплика продлила бы жизнь отозванному токену на весь TTL
+        with primary_reads():
+            row = User.objects.filter(pk=user_id).values('token_version', 'is_active', 'is_staff').first()
+        state = row or {}
+        cache.set(key, state, settings.JWT_USER_STATE_TTL)
+    return state or None
+
+
+def forget_token_state(*user_ids):
+    cache.delete_many([token_state_key(pk) for pk in user_ids])
+
+
+class ClaimsUser(TokenUser):
+    """Пользователь, собранный из claims access-токена без обращения к таблице пользователей."""
+
+    @cached_property
+    def id(self) -> int:
+        return int(self.token[api_settings.USER_ID_CLAIM])
+
+    @cached_property
+    def email(self) -> str:
+        return self.token.get('email', '')
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    Для безопасных методов (GET/HEAD/OPTIONS) request.user строится из claims токена
+    (id, email, is_staff, is_moderator), а версия токена сверяется с кешем get_token_state.
+    Изменяющие запросы по-прежнему получают полноценного пользователя из БД.
+    """
+
+    def authenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        validated_token = self.get_validated_token(raw_token)
+        if request.method in SAFE_METHODS:
+            return self.get_claims_user(validated_token), validated_token
+        return self.get_user(validated_token), validated_token
+
+    def get_claims_user(self, validated_token):
+        if api_settings.USER_ID_CLAIM not in validated_token:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        user = ClaimsUser(validated_token)
+        # недавно писавший пользователь читает с primary, включая состояние токена
+        identify(user.id)
+        state = get_token_state(user.id)
+        if state is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        if not state['is_active']:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if validated_token.get('ver', 0) != state['token_version'] or user.is_staff != state['is_staff']:
+            raise AuthenticationFailed(_("Token is outdated"), code="token_outdated")
+
+        remember_roles(user, is_moderator=bool(validated_token.get('is_moderator', False)))
+        return user
+
+    def get_user(self, validated_token):
+        user = super().get_user(validated_token)
+        if validated_token.get('ver', 0) != user.token_version:
+            raise AuthenticationFailed(_("Token is outdated"), code="token_outdated")
+        return user
@@ -0,0 +1,71 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from lms.models import Subscription
+from users.filters import PaymentFilter
+from users.models import Payment
+
+# Индексы из users.0011 и lms.0009, которые сравниваются в режиме --compare
+INDEXES = (
+    'payment_course_paid_idx',
+    'payment_lesson_paid_idx',
+    'payment_method_paid_idx',
+    'payment_stripe_pending_idx',
+    'lms_subscription_user_course_uniq',
+)
+
+
+def sample_queries():
+    """
+    Запросы в том виде, в каком их строят PaymentListView, SubscriptionToggleView
+    и выборка зависших Stripe-платежей.
+    """
+    course_id = Payment.objects.exclude(course=None).values_list('course_id', flat=True).first() or 1
+    lesson_id = Payment.objects.exclude(lesson=None).values_list('lesson_id', flat=True).first() or 1
+    subscription = Subscription.objects.first()
+    payments = Payment.objects.order_by('-paid_at')
+    return {
+        'payments ?course=': PaymentFilter({'course': course_id}, queryset=payments).qs[:20],
+        'payments ?lesson=': PaymentFilter({'lesson': lesson_id}, queryset=payments).qs[:20],
+        'payments ?method=': PaymentFilter({'method': Payment.Method.CASH}, queryset=payments).qs[:20],
+        'pending stripe': Payment.objects.filter(
+            method=Payment.Method.STRIPE, status=Payment.Status.PENDING,
+        ).order_by('paid_at')[:100],
+        'subscription (user, course)': Subscription.objects.filter(
+            user_id=subscription.user_id if subscription else 1,
+            course_id=subscription.course_id if subscription else 1,
+        ),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Показать планы запросов к платежам и подпискам. С --compare сначала показывает планы '
+        'без составных индексов (удаляются внутри транзакции, которая откатывается; на время '
+        'выполнения таблицы блокируются — запускать на копии базы).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--analyze', action='store_true', help='EXPLAIN ANALYZE вместо EXPLAIN')
+        parser.add_argument('--compare', action='store_true', help='Показать также планы без новых индексов')
+
+    def handle(self, *args, **options):
+        explain = {'analyze': True} if options['analyze'] else {}
+        if options['compare']:
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    for name in INDEXES:
+                        if name.endswith('_uniq'):
+                            cursor.execute(f'ALTER TABLE lms_subscription DROP CONSTRAINT IF EXISTS {name}')
+                        else:
+                            cursor.execute(f'DROP INDEX IF EXISTS {name}')
+                self.print_plans('До (без составных индексов)', explain)
+                transaction.set_rollback(True)
+        self.print_plans('После', explain)
+
+    def print_plans(self, title, explain):
+        self.stdout.write(self.style.MIGRATE_HEADING(f'== {title} =='))
+        for label, qs in sample_queries().items():
+            self.stdout.write(self.style.SUCCESS(label))
+            self.stdout.write(qs.explain(**explain))
+            self.stdout.write('')
@@ -0,0 +1,217 @@
+import csv
+import io
+import random
+import time
+from bisect import bisect
+from datetime import timedelta
+from decimal import Decimal
+from itertools import accumulate
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils.timezone import now
+
+from lms.models import Course, Lesson, Subscription
+from lms.tasks import chunked
+from users.models import Payment
+
+User = get_user_model()
+
+PRICES = (Decimal('0'), Decimal('990'), Decimal('1990'), Decimal('4990'), Decimal('9990'))
+PRICE_WEIGHTS = (10, 25, 35, 20, 10)
+METHOD_WEIGHTS = {Payment.Method.STRIPE: 55, Payment.Method.TRANSFER: 30, Payment.Method.CASH: 15}
+STATUS_WEIGHTS = {Payment.Status.PAID: 80, Payment.Status.FAILED: 8, Payment.Status.PENDING: 7, Payment.Status.NEW: 5}
+WORDS = (
+    'python', 'django', 'алгоритмы', 'базы данных', 'асинхронность', 'тестирование', 'архитектура',
+    'postgresql', 'очереди', 'кеширование', 'безопасность', 'rest', 'профилирование', 'docker',
+)
+
+
+class CopyStream(io.RawIOBase):
+    """Файлоподобный объект поверх генератора строк CSV для COPY ... FROM STDIN."""
+
+    def __init__(self, lines):
+        self.lines = lines
+        self.buffer = b''
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            chunk = next(self.lines, None)
+            if chunk is None:
+                break
+            self.buffer += chunk.encode()
+        if size < 0:
+            size = len(self.buffer)
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+class Command(BaseCommand):
+    help = (
+        'Сгенерировать нагрузочный набор данных: пользователи, курсы, уроки, подписки и платежи '
+        'с реалистичными распределениями (популярность курсов по Ципфу, рост платежей со временем). '
+        'Одинаковый --seed даёт одинаковые данные. Платежи пишутся через COPY.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--courses', type=int, default=100)
+        parser.add_argument('--lessons-per-course', type=int, default=10, help='Среднее число уроков в курсе')
+        parser.add_argument('--subscriptions', type=int, default=5000)
+        parser.add_argument('--payments', type=int, default=10000)
+        parser.add_argument('--years', type=float, default=3, help='За сколько лет распределены платежи')
+        parser.add_argument('--zipf', type=float, default=1.1, help='Показатель перекоса популярности курсов')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--prefix', default='load', help='Префикс email создаваемых пользователей')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        prefix = options['prefix']
+        if User.objects.filter(email__startswith=f'{prefix}-').exists():
+            raise CommandError(f'Пользователи с префиксом «{prefix}» уже есть: задайте другой --prefix.')
+        if options['users'] < 1 or options['courses'] < 1:
+            raise CommandError('Нужен хотя бы один пользователь и один курс.')
+
+        started = time.monotonic()
+        with transaction.atomic():
+            user_ids = self.step('users', lambda: self.create_users(options['users'], prefix))
+            course_ids = self.step('courses', lambda: self.create_courses(options['courses'], user_ids))
+            lesson_ids = self.step(
+                'lessons', lambda: self.create_lessons(course_ids, options['lessons_per_course'])
+            )
+            popularity = list(accumulate(1 / rank ** options['zipf'] for rank in range(1, len(course_ids) + 1)))
+            self.step(
+                'subscriptions',
+                lambda: self.create_subscriptions(options['subscriptions'], user_ids, course_ids, popularity),
+            )
+            self.step(
+                'payments',
+                lambda: self.copy_payments(
+                    options['payments'], user_ids, course_ids, lesson_ids, popularity, options['years']
+                ),
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.monotonic() - started:.1f} с. Для аналитики запустите refresh_payment_rollup.'
+        ))
+
+    def step(self, name, create):
+        started = time.monotonic()
+        result = create()
+        count = result if isinstance(result, int) else len(result)
+        self.stdout.write(f'{name}: {count} за {time.monotonic() - started:.1f} с')
+        return result
+
+    def create_users(self, n, prefix) -> list[int]:
+        # один и тот же непригодный для входа пароль: хешировать его на каждого пользователя незачем
+        password = make_password(None)
+        modes = list(User.NotificationMode.values)
+        ids = []
+        for chunk in chunked(range(n), self.batch_size):
+            users = [
+                User(
+                    email=f'{prefix}-{i}@load.test', password=password,
+                    course_notifications=self.rng.choices(modes, weights=(80, 20))[0],
+                )
+                for i in chunk
+            ]
+            ids += [u.pk for u in User.objects.bulk_create(users)]
+        return ids
+
+    def title(self, words=3):
+        return ' '.join(self.rng.sample(WORDS, words)).capitalize()
+
+    def create_courses(self, n, user_ids) -> list[int]:
+        # курсы ведёт небольшая доля пользователей-авторов
+        authors = user_ids[:max(1, len(user_ids) // 50)]
+        ids = []
+        for chunk in chunked(range(n), self.batch_size):
+            courses = [
+                Course(
+                    name=f'{self.title()} #{i}', description=self.title(6),
+                    owner_id=self.rng.choice(authors),
+                    price=self.rng.choices(PRICES, weights=PRICE_WEIGHTS)[0],
+                )
+                for i in chunk
+            ]
+            ids += [c.pk for c in Course.objects.bulk_create(courses)]
+        return ids
+
+    def create_lessons(self, course_ids, per_course) -> list[int]:
+        owners = dict(Course.objects.filter(pk__in=course_ids).values_list('id', 'owner_id'))
+
+        def lessons():
+            for course_id in course_ids:
+                for i in range(max(1, round(self.rng.expovariate(1 / per_course)))):
+                    yield Lesson(
+                        name=f'{self.title(2)} {i + 1}', description=self.title(5),
+                        video_url=f'https://www.youtube.com/watch?v={self.rng.getrandbits(40):010x}',
+                        course_id=course_id, owner_id=owners[course_id],
+                    )
+
+        ids = []
+        for chunk in chunked(lessons(), self.batch_size):
+            ids += [lesson.pk for lesson in Lesson.objects.bulk_create(chunk)]
+        return ids
+
+    def pick_course(self, course_ids, popularity):
+        return course_ids[bisect(popularity, self.rng.random() * popularity[-1])]
+
+    def create_subscriptions(self, n, user_ids, course_ids, popularity) -> int:
+        """Повторные пары (user, course) отбрасываются уникальным индексом, поэтому создаётся чуть меньше n."""
+        before = Subscription.objects.count()
+        pairs = (
+            Subscription(user_id=self.rng.choice(user_ids), course_id=self.pick_course(course_ids, popularity))
+            for _ in range(n)
+        )
+        for chunk in chunked(pairs, self.batch_size):
+            Subscription.objects.bulk_create(chunk, ignore_conflicts=True)
+        return Subscription.objects.count() - before
+
+    def copy_payments(self, n, user_ids, course_ids, lesson_ids, popularity, years) -> int:
+        created = now()
+        span = timedelta(days=365 * years).total_seconds()
+        prices = dict(Course.objects.filter(pk__in=course_ids).values_list('id', 'price'))
+        methods, method_weights = list(METHOD_WEIGHTS), list(accumulate(METHOD_WEIGHTS.values()))
+        statuses, status_weights = list(STATUS_WEIGHTS), list(accumulate(STATUS_WEIGHTS.values()))
+        rng = self.rng
+        columns = ['user_id', 'paid_at', 'course_id', 'lesson_id', 'amount', 'method', 'status', 'updated_at']
+
+        def lines():
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            for chunk in chunked(range(n), self.batch_size):
+                for _ in chunk:
+                    # треугольное распределение: чем ближе к сегодняшнему дню, тем больше платежей
+                    paid_at = created - timedelta(seconds=span - rng.triangular(0, span, span))
+                    if lesson_ids and rng.random() < 0.1:
+                        course_id, lesson_id, amount = '', rng.choice(lesson_ids), Decimal('299')
+                    else:
+                        course_id, lesson_id = self.pick_course(course_ids, popularity), ''
+                        amount = prices[course_id] or Decimal('490')
+                    writer.writerow((
+                        rng.choice(user_ids), paid_at.isoformat(), course_id, lesson_id, amount,
+                        methods[bisect(method_weights, rng.random() * method_weights[-1])],
+                        statuses[bisect(status_weights, rng.random() * status_weights[-1])],
+                        created.isoformat(),
+                    ))
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+
+        sql = f'COPY {Payment._meta.db_table} ({", ".join(columns)}) FROM STDIN WITH (FORMAT csv)'
+        with connection.cursor() as cursor:
+            raw = cursor.cursor
+            if hasattr(raw, 'copy_expert'):
+                raw.copy_expert(sql, CopyStream(lines()), size=1 << 20)
+            else:
+                with raw.copy(sql) as copy:
+                    for block in lines():
+                        copy.write(block)
+        return n
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("lms", "0006_course_last_notification_sent_course_updated_at"),
+        ("users", "0006_alter_payment_checkout_url"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StripePrice",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "amount",
+                    models.DecimalField(
+                        decimal_places=2, max_digits=10, verbose_name="Сумма"
+                    ),
+                ),
+                ("currency", models.CharField(max_length=3, verbose_name="Валюта")),
+                (
+                    "name",
+                    models.CharField(max_length=150, verbose_name="Название продукта"),
+                ),
+                (
+                    "price_id",
+                    models.CharField(max_length=255, verbose_name="ID цены Stripe"),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "course",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="stripe_prices",
+                        to="lms.course",
+                        verbose_name="Курс",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "цена Stripe",
+                "verbose_name_plural": "цены Stripe",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("course", "amount", "currency"),
+                        name="uniq_stripe_price_course_amount",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0007_stripeprice"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="customuser",
+            name="course_notifications",
+            field=models.CharField(
+                choices=[
+                    ("instant", "Письмо по каждому курсу"),
+                    ("digest", "Сводка по всем курсам"),
+                ],
+                default="instant",
+                max_length=10,
+                verbose_name="Уведомления об обновлении курсов",
+            ),
+        ),
+        migrations.AddField(
+            model_name="customuser",
+            name="last_digest_sent_at",
+            field=models.DateTimeField(
+                blank=True, null=True, verbose_name="Последняя сводка"
+            ),
+        ),
+    ]
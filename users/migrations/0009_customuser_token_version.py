@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0008_customuser_course_notifications"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="customuser",
+            name="token_version",
+            field=models.PositiveIntegerField(default=0, verbose_name="Версия JWT"),
+        ),
+    ]
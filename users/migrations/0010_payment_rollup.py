@@ -0,0 +1,101 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("lms", "0008_search_vector"),
+        ("users", "0009_customuser_token_version"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PaymentDailyRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField(verbose_name="День")),
+                (
+                    "method",
+                    models.CharField(
+                        choices=[
+                            ("cash", "Наличные"),
+                            ("transfer", "Перевод на счёт"),
+                            ("stripe", "Stripe"),
+                        ],
+                        max_length=20,
+                        verbose_name="Способ оплаты",
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("new", "New"),
+                            ("pending", "Pending"),
+                            ("paid", "Paid"),
+                            ("failed", "Failed"),
+                        ],
+                        max_length=20,
+                        verbose_name="Статус платежа",
+                    ),
+                ),
+                (
+                    "revenue",
+                    models.DecimalField(
+                        decimal_places=2, max_digits=14, verbose_name="Выручка"
+                    ),
+                ),
+                (
+                    "count",
+                    models.PositiveIntegerField(verbose_name="Количество платежей"),
+                ),
+                ("refreshed_at", models.DateTimeField(verbose_name="Пересчитан")),
+            ],
+            options={
+                "verbose_name": "сводка платежей за день",
+                "verbose_name_plural": "сводки платежей по дням",
+            },
+        ),
+        migrations.AddField(
+            model_name="payment",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True, verbose_name="Изменён"),
+        ),
+        migrations.AddField(
+            model_name="paymentdailyrollup",
+            name="course",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="payment_rollups",
+                to="lms.course",
+                verbose_name="Курс",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="paymentdailyrollup",
+            index=models.Index(
+                fields=["refreshed_at"], name="users_payme_refresh_099218_idx"
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="paymentdailyrollup",
+            constraint=models.UniqueConstraint(
+                fields=("day", "course", "method", "status"),
+                name="uniq_payment_rollup_bucket",
+                nulls_distinct=False,
+            ),
+        ),
+    ]
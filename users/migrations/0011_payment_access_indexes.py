@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:57
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # индексы на большой таблице платежей строятся без блокировки записи
+    atomic = False
+
+    dependencies = [
+        ("lms", "0009_subscription_unique"),
+        ("users", "0010_payment_rollup"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="payment",
+            index=models.Index(
+                fields=["course", "-paid_at"], name="payment_course_paid_idx"
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="payment",
+            index=models.Index(
+                fields=["lesson", "-paid_at"], name="payment_lesson_paid_idx"
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="payment",
+            index=models.Index(
+                fields=["method", "-paid_at"], name="payment_method_paid_idx"
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="payment",
+            index=models.Index(
+                condition=models.Q(("method", "stripe"), ("status", "pending")),
+                fields=["paid_at"],
+                name="payment_stripe_pending_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:05
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # индекс на большой таблице платежей строится без блокировки записи
+    atomic = False
+
+    dependencies = [
+        ("users", "0011_payment_access_indexes"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="payment",
+            index=models.Index(
+                fields=["updated_at"], name="users_payme_updated_8b1adc_idx"
+            ),
+        ),
+    ]
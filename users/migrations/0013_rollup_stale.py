@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0012_payment_updated_at_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="paymentdailyrollup",
+            name="stale",
+            field=models.BooleanField(default=False, verbose_name="Устарела"),
+        ),
+    ]
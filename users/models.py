@@ -29,11 +29,23 @@ class CustomUserManager(BaseUserManager):
 
 
 class CustomUser(AbstractUser):
+    class NotificationMode(models.TextChoices):
+        INSTANT = 'instant', 'Письмо по каждому курсу'
+        DIGEST = 'digest', 'Сводка по всем курсам'
+
     username = None
     email = models.EmailField(unique=True)
     avatar = models.ImageField(upload_to='avatars/', blank=True, null=True)
     phone = models.CharField(max_length=15, blank=True, null=True)
     city = models.CharField(max_length=50, blank=True, null=True)
+    course_notifications = models.CharField(
+        max_length=10,
+        choices=NotificationMode.choices,
+        default=NotificationMode.INSTANT,
+        verbose_name='Уведомления об обновлении курсов',
+    )
+    last_digest_sent_at = models.DateTimeField(null=True, blank=True, verbose_name='Последняя сводка')
+    token_version = models.PositiveIntegerField(default=0, verbose_name='Версия JWT')
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = []
@@ -107,6 +119,7 @@ class Payment(models.Model):
         blank=True, null=True,
         verbose_name='Ссылка на оплату'
     )
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Изменён')
 
     class Meta:
         verbose_name = 'платёж'
@@ -114,5 +127,73 @@ class Payment(models.Model):
         indexes = [
             models.Index(fields=['user']),
             models.Index(fields=['paid_at']),
+            models.Index(fields=['updated_at']),
+            # PaymentFilter: фильтр по одному полю + сортировка по -paid_at
+            models.Index(fields=['course', '-paid_at'], name='payment_course_paid_idx'),
+            models.Index(fields=['lesson', '-paid_at'], name='payment_lesson_paid_idx'),
+            models.Index(fields=['method', '-paid_at'], name='payment_method_paid_idx'),
+            models.Index(
+                fields=['paid_at'],
+                name='payment_stripe_pending_idx',
+                condition=models.Q(method='stripe', status='pending'),
+            ),
         ]
         ordering = ['-paid_at']
+
+
+class PaymentDailyRollup(models.Model):
+    """Дневной агрегат платежей по (курс, способ, статус); пересчитывается задачей refresh_payment_rollup."""
+    day = models.DateField(verbose_name='День')
+    course = models.ForeignKey(
+        'lms.Course',
+        on_delete=models.CASCADE,
+        verbose_name='Курс',
+        null=True, blank=True,
+        related_name='payment_rollups',
+    )
+    method = models.CharField(verbose_name='Способ оплаты', max_length=20, choices=Payment.Method.choices)
+    status = models.CharField(verbose_name='Статус платежа', max_length=20, choices=Payment.Status.choices)
+    revenue = models.DecimalField(verbose_name='Выручка', max_digits=14, decimal_places=2)
+    count = models.PositiveIntegerField(verbose_name='Количество платежей')
+    refreshed_at = models.DateTimeField(verbose_name='Пересчитан')
+    # день нужно пересчитать: из него удалили платёж (удалённые строки не видны по updated_at)
+    stale = models.BooleanField(verbose_name='Устарела', default=False)
+
+    class Meta:
+        verbose_name = 'сводка платежей за день'
+        verbose_name_plural = 'сводки платежей по дням'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['day', 'course', 'method', 'status'],
+                name='uniq_payment_rollup_bucket',
+                nulls_distinct=False,
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['refreshed_at']),
+        ]
+
+
+class StripePrice(models.Model):
+    """Созданная в Stripe пара Product+Price для курса с конкретной суммой и валютой."""
+    course = models.ForeignKey(
+        'lms.Course',
+        on_delete=models.CASCADE,
+        verbose_name='Курс',
+        related_name='stripe_prices',
+    )
+    amount = models.DecimalField(verbose_name='Сумма', max_digits=10, decimal_places=2)
+    currency = models.CharField(verbose_name='Валюта', max_length=3)
+    name = models.CharField(verbose_name='Название продукта', max_length=150)
+    price_id = models.CharField(verbose_name='ID цены Stripe', max_length=255)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'цена Stripe'
+        verbose_name_plural = 'цены Stripe'
+        constraints = [
+            models.UniqueConstraint(fields=['course', 'amount', 'currency'], name='uniq_stripe_price_course_amount'),
+        ]
+
+    def __str__(self):
+        return f"{self.course_id} {self.amount} {self.currency} → {self.price_id}"
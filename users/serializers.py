@@ -4,6 +4,8 @@ from django.contrib.auth.password_validation import validate_password
 from django.contrib.auth import get_user_model
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 
+from lms.roles import is_moderator
+
 User = get_user_model()
 
 
@@ -19,6 +21,33 @@ class PaymentSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'user', 'paid_at', 'status', 'stripe_session_id', 'checkout_url']
 
 
+class PaymentStatusSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Payment
+        fields = ['id', 'status', 'stripe_session_id', 'checkout_url']
+        read_only_fields = fields
+
+
+class PaymentAnalyticsQuerySerializer(serializers.Serializer):
+    period = serializers.ChoiceField(choices=['day', 'week', 'month'], default='day')
+    group_by = serializers.MultipleChoiceField(choices=['course', 'method', 'status'], required=False)
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    status = serializers.MultipleChoiceField(choices=Payment.Status.choices, required=False)
+    method = serializers.MultipleChoiceField(choices=Payment.Method.choices, required=False)
+    course = serializers.IntegerField(required=False)
+
+
+class PaymentAnalyticsRowSerializer(serializers.Serializer):
+    period = serializers.DateField()
+    course = serializers.IntegerField(source='course_id', allow_null=True, required=False)
+    method = serializers.CharField(required=False)
+    status = serializers.CharField(required=False)
+    revenue = serializers.DecimalField(max_digits=14, decimal_places=2)
+    count = serializers.IntegerField()
+    average = serializers.DecimalField(max_digits=14, decimal_places=2)
+
+
 class PaymentCheckoutSerializer(serializers.ModelSerializer):
     class Meta:
         model = Payment
@@ -42,6 +71,9 @@ class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
 
         token['username'] = user.username
         token['email'] = user.email
+        token['is_staff'] = user.is_staff
+        token['is_moderator'] = is_moderator(user)
+        token['ver'] = user.token_version
 
         return token
 
@@ -64,5 +96,6 @@ class RegisterSerializer(serializers.ModelSerializer):
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
-        fields = ("id", "email", "first_name", "last_name", "avatar", "phone", "city", "is_active", "is_staff")
+        fields = ("id", "email", "first_name", "last_name", "avatar", "phone", "city", "is_active", "is_staff",
+                  "course_notifications")
         read_only_fields = ("id", "is_active", "is_staff")
@@ -0,0 +1,66 @@
+from django.contrib.auth import get_user_model
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils.timezone import localdate
+
+from lms.models import Course
+from .authentication import forget_token_state
+from .models import Payment, PaymentDailyRollup
+from .stripe_checkout import invalidate_course_prices
+
+User = get_user_model()
+
+
+PRICE_FIELDS = {'name', 'price'}
+
+
+@receiver(pre_save, sender=Course)
+def remember_course_price_basis(sender, instance, update_fields=None, **kwargs):
+    """Название и цена до сохранения: post_save сравнит их с новыми."""
+    instance._price_basis = None
+    if instance._state.adding or (update_fields is not None and not PRICE_FIELDS & set(update_fields)):
+        return
+    instance._price_basis = Course.objects.filter(pk=instance.pk).values_list('name', 'price').first()
+
+
+@receiver(post_save, sender=Course)
+def invalidate_stripe_prices_on_course_change(sender, instance, created=False, **kwargs):
+    """
+    Смена названия или цены курса делает сохранённые Stripe-цены устаревшими. Сохранение
+    без изменения этих полей (например, PATCH описания) цены не трогает.
+    """
+    before = getattr(instance, '_price_basis', None)
+    if created or before is None or before == (instance.name, instance.price):
+        return
+    invalidate_course_prices(instance)
+
+
+@receiver(post_delete, sender=Payment)
+def mark_rollup_day_stale(sender, instance, **kwargs):
+    """
+    Удалённый платёж (в том числе каскадом вместе с пользователем) не найти по updated_at:
+    помечаем его день в сводке, и refresh_payment_rollup пересчитает этот день.
+    """
+    PaymentDailyRollup.objects.filter(day=localdate(instance.paid_at), stale=False).update(stale=True)
+
+
+@receiver(post_save, sender=User)
+def forget_token_state_on_user_save(sender, instance, **kwargs):
+    """is_active/is_staff могли измениться — следующий GET перечитает их из БД."""
+    forget_token_state(instance.pk)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def bump_token_version_on_groups_change(sender, instance, action, reverse, pk_set, **kwargs):
+    """Роль модератора зашита в токен: смена групп отзывает ранее выданные токены."""
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if reverse:
+        user_ids = set(pk_set or ()) if action != 'pre_clear' else set(instance.user_set.values_list('pk', flat=True))
+    else:
+        user_ids = {instance.pk}
+    if not user_ids:
+        return
+    User.objects.filter(pk__in=user_ids).update(token_version=F('token_version') + 1)
+    forget_token_state(*user_ids)
@@ -2,10 +2,14 @@ from django.urls import reverse
 from django.http import HttpRequest
 from decimal import Decimal
 from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
 
-from .models import Payment
+from .models import Payment, StripePrice
 from .stripe_gateway import StripeGateway
 
+PRICE_CACHE_TTL = 60 * 60 * 24
+
 
 def build_item_name(payment: Payment) -> str:
     """Имя позиции: только курс."""
@@ -14,22 +18,91 @@ def build_item_name(payment: Payment) -> str:
     return "Course"
 
 
-def kickoff_checkout(payment: Payment, request: HttpRequest) -> tuple[str, str]:
+def price_cache_key(course_id: int, amount: Decimal, currency: str) -> str:
+    return f"stripe_price:{course_id}:{Decimal(amount):.2f}:{currency.lower()}"
+
+
+def get_or_create_price_id(gw: StripeGateway, payment: Payment, currency: str) -> str:
     """
-    Создаёт в Stripe Product+Price+CheckoutSession для оплаты курса.
-    Возвращает (session_id, checkout_url).
+    Вернуть price_id для (курс, сумма, валюта): сначала кеш, затем таблица StripePrice,
+    и только при промахе — Product+Price в Stripe. Оплата без курса не кешируется.
     """
-    gw = StripeGateway()
+    amount = Decimal(payment.amount)
     item_name = build_item_name(payment)
-    currency = getattr(settings, "STRIPE_CURRENCY", "rub")
+    if payment.course_id is None:
+        return gw.create_product_and_price(name=item_name, amount=amount, currency=currency)
 
-    price_id = gw.create_product_and_price(
-        name=item_name,
-        amount=Decimal(payment.amount),
-        currency=currency,
+    key = price_cache_key(payment.course_id, amount, currency)
+    price_id = cache.get(key)
+    if price_id:
+        return price_id
+
+    price_id = (
+        StripePrice.objects
+        .filter(course_id=payment.course_id, amount=amount, currency=currency.lower())
+        .values_list("price_id", flat=True)
+        .first()
     )
+    if not price_id:
+        price_id = gw.create_product_and_price(name=item_name, amount=amount, currency=currency)
+        try:
+            with transaction.atomic():
+                StripePrice.objects.create(
+                    course_id=payment.course_id, amount=amount, currency=currency.lower(),
+                    name=item_name, price_id=price_id,
+                )
+        except IntegrityError:
+            # параллельный checkout успел сохранить свою цену — используем её
+            price_id = StripePrice.objects.get(
+                course_id=payment.course_id, amount=amount, currency=currency.lower()
+            ).price_id
+
+    cache.set(key, price_id, PRICE_CACHE_TTL)
+    return price_id
+
+
+def invalidate_course_prices(course) -> int:
+    """Удалить сохранённые цены курса, устаревшие после смены названия или цены."""
+    stale = StripePrice.objects.filter(course_id=course.pk).exclude(name=course.name, amount=course.price)
+    keys = [
+        price_cache_key(course.pk, amount, currency)
+        for amount, currency in stale.values_list("amount", "currency")
+    ]
+    if not keys:
+        return 0
+    cache.delete_many(keys)
+    deleted, _ = stale.delete()
+    return deleted
+
+
+def checkout_return_urls(request: HttpRequest) -> tuple[str, str]:
+    """(success_url, cancel_url) для Checkout Session."""
+    url = request.build_absolute_uri(reverse("payment-list"))
+    return url, url
 
-    success_url = request.build_absolute_uri(reverse("payment-list"))
-    cancel_url = request.build_absolute_uri(reverse("payment-list"))
 
-    return gw.start_checkout(price_id=price_id, success_url=success_url, cancel_url=cancel_url)
+def start_payment_checkout(payment: Payment, success_url: str, cancel_url: str,
+                           gw: StripeGateway | None = None) -> tuple[str, str]:
+    """
+    Создаёт CheckoutSession для платежа и сохраняет stripe_session_id/checkout_url.
+    Product+Price переиспользуются из StripePrice, если курс уже оплачивали на эту сумму.
+    """
+    gw = gw or StripeGateway()
+    currency = getattr(settings, "STRIPE_CURRENCY", "rub")
+
+    price_id = get_or_create_price_id(gw, payment, currency)
+    session_id, url = gw.start_checkout(price_id=price_id, success_url=success_url, cancel_url=cancel_url)
+
+    payment.stripe_session_id = session_id
+    payment.checkout_url = url
+    payment.save(update_fields=["stripe_session_id", "checkout_url"])
+    return session_id, url
+
+
+def kickoff_checkout(payment: Payment, request: HttpRequest) -> tuple[str, str]:
+    """
+    Синхронно создаёт в Stripe CheckoutSession для оплаты курса.
+    Возвращает (session_id, checkout_url).
+    """
+    success_url, cancel_url = checkout_return_urls(request)
+    return start_payment_checkout(payment, success_url, cancel_url)
@@ -1,16 +1,90 @@
+import time
+
 from celery import shared_task
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
 from django.utils.timezone import now
 from dateutil.relativedelta import relativedelta
 from django.contrib.auth import get_user_model
 from django.db.models import Q
+import stripe
+
+from config.task_metrics import event
+
+from . import analytics
+from .authentication import forget_token_state
+from .models import Payment
+from .stripe_checkout import start_payment_checkout
 
 User = get_user_model()
 
+DEACTIVATE_CHECKPOINT_KEY = 'users:deactivate-inactive:last-pk'
+
+
 @shared_task
-def deactivate_inactive_users():
+def deactivate_inactive_users(batch_size: int | None = None, pause: float | None = None):
+    """
+    Деактивирует пользователей без входа больше месяца (или ни разу не входивших)
+    пачками по первичному ключу: каждая пачка — короткая транзакция, между пачками можно
+    сделать паузу. Последний обработанный pk сохраняется в кеше, поэтому прерванный
+    запуск продолжается с места остановки. Возвращает метрики прогона.
+    """
+    batch_size = batch_size or settings.DEACTIVATE_USERS_BATCH_SIZE
+    pause = settings.DEACTIVATE_USERS_BATCH_PAUSE if pause is None else pause
+    started = time.monotonic()
+
     month_ago = now() - relativedelta(months=1)
-    qs = User.objects.filter(is_active=True).filter(
-    )
-    qs = qs.filter(Q(last_login__lt=month_ago) | Q(last_login__isnull=True))
-    updated = qs.update(is_active=False)
-    return updated
+    inactive = Q(is_active=True) & (Q(last_login__lt=month_ago) | Q(last_login__isnull=True))
+
+    last_pk = cache.get(DEACTIVATE_CHECKPOINT_KEY, 0)
+    resumed_from = last_pk
+    batches = rows = 0
+    while True:
+        with transaction.atomic():
+            ids = list(
+                User.objects.filter(inactive, pk__gt=last_pk)
+                .order_by('pk')
+                .values_list('pk', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            rows += User.objects.filter(inactive, pk__in=ids).update(is_active=False)
+        forget_token_state(*ids)
+        batches += 1
+        last_pk = ids[-1]
+        cache.set(DEACTIVATE_CHECKPOINT_KEY, last_pk, timeout=60 * 60 * 24)
+        if pause:
+            time.sleep(pause)
+
+    cache.delete(DEACTIVATE_CHECKPOINT_KEY)
+    event('batches', batches)
+    event('rows', rows)
+    return {
+        'batches': batches,
+        'rows': rows,
+        'resumed_from_pk': resumed_from,
+        'elapsed': round(time.monotonic() - started, 3),
+    }
+
+
+@shared_task
+def create_checkout_session(payment_id: int, success_url: str, cancel_url: str):
+    """Создать Checkout Session для платежа в фоне; при ошибке Stripe платёж помечается FAILED."""
+    payment = Payment.objects.select_related('course').filter(pk=payment_id).first()
+    if payment is None or payment.stripe_session_id or payment.status != Payment.Status.PENDING:
+        return None
+
+    try:
+        session_id, _ = start_payment_checkout(payment, success_url, cancel_url)
+    except stripe.StripeError:
+        payment.status = Payment.Status.FAILED
+        payment.save(update_fields=['status', 'updated_at'])
+        return None
+    return session_id
+
+
+@shared_task
+def refresh_payment_rollup():
+    """Инкрементально обновить дневную сводку платежей для аналитики."""
+    return analytics.refresh_payment_rollup()
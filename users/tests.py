@@ -1,3 +1,379 @@
-from django.test import TestCase
+import io
+import json
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.contrib.auth.models import Group
+from django.db import connection, router
+from django.db.models import Count, Sum
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import localtime, now, timedelta
+from django.urls import reverse
+import stripe
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from config.db_router import replica_reads
+from lms.models import Course
+from users.authentication import get_token_state
+from users.analytics import refresh_payment_rollup
+from users.models import Payment, PaymentDailyRollup, StripePrice
+from users.stripe_checkout import get_or_create_price_id
+from users.views import PaymentExportView
+from users.tasks import DEACTIVATE_CHECKPOINT_KEY, create_checkout_session, deactivate_inactive_users
+
+User = get_user_model()
+
+
+class FakeGateway:
+    """Подменяет StripeGateway: считает вызовы и не ходит в сеть."""
+
+    def __init__(self):
+        self.prices_created = 0
+        self.sessions_created = 0
+
+    def create_product_and_price(self, *, name, amount, currency="usd"):
+        self.prices_created += 1
+        return f"price_{self.prices_created}"
+
+    def start_checkout(self, *, price_id, success_url, cancel_url):
+        self.sessions_created += 1
+        return f"cs_{self.sessions_created}", f"https://checkout.stripe.test/{price_id}"
+
+
+class StripePriceCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(email="buyer@test.com")
+        self.course = Course.objects.create(name="Python", description="d", price=Decimal("100.00"))
+        self.gw = FakeGateway()
+
+    def make_payment(self, amount="100.00"):
+        return Payment.objects.create(
+            user=self.user, course=self.course, amount=Decimal(amount),
+            method=Payment.Method.STRIPE, status=Payment.Status.PENDING,
+        )
+
+    def test_repeat_checkout_reuses_price(self):
+        first = get_or_create_price_id(self.gw, self.make_payment(), "rub")
+        cache.clear()  # второй раз — из БД
+        second = get_or_create_price_id(self.gw, self.make_payment(), "rub")
+        third = get_or_create_price_id(self.gw, self.make_payment(), "rub")
+        self.assertEqual(first, second)
+        self.assertEqual(second, third)
+        self.assertEqual(self.gw.prices_created, 1)
+        self.assertEqual(StripePrice.objects.count(), 1)
+
+    def test_other_amount_gets_own_price(self):
+        get_or_create_price_id(self.gw, self.make_payment("100.00"), "rub")
+        get_or_create_price_id(self.gw, self.make_payment("150.00"), "rub")
+        self.assertEqual(self.gw.prices_created, 2)
+
+    def test_course_rename_invalidates_price(self):
+        get_or_create_price_id(self.gw, self.make_payment(), "rub")
+        self.course.name = "Python 2"
+        self.course.save()
+        self.assertFalse(StripePrice.objects.exists())
+        get_or_create_price_id(self.gw, self.make_payment(), "rub")
+        self.assertEqual(self.gw.prices_created, 2)
+
+    def test_unrelated_update_keeps_price(self):
+        get_or_create_price_id(self.gw, self.make_payment(), "rub")
+        get_or_create_price_id(self.gw, self.make_payment("150.00"), "rub")
+        self.course.description = "new"
+        self.course.save()
+        get_or_create_price_id(self.gw, self.make_payment(), "rub")
+        get_or_create_price_id(self.gw, self.make_payment("150.00"), "rub")
+        self.assertEqual(self.gw.prices_created, 2)
+
+    def test_price_change_invalidates_other_amounts(self):
+        get_or_create_price_id(self.gw, self.make_payment("150.00"), "rub")
+        self.course.price = Decimal("150.00")
+        self.course.save(update_fields=["price"])
+        self.assertTrue(StripePrice.objects.exists())
+        self.course.price = Decimal("200.00")
+        self.course.save()
+        self.assertFalse(StripePrice.objects.exists())
+
+
+class AsyncCheckoutTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(email="async@test.com")
+        self.course = Course.objects.create(name="Django", description="d", price=Decimal("500.00"))
+        self.client.force_authenticate(user=self.user)
+        self.gw = FakeGateway()
+        patcher = mock.patch("users.stripe_checkout.StripeGateway", return_value=self.gw)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def checkout(self, **params):
+        url = reverse("payment-checkout") + "?" + "&".join(f"{k}={v}" for k, v in params.items())
+        return self.client.post(url, {"course": self.course.id, "amount": "500.00"}, format="json")
+
+    def test_async_checkout_returns_202_and_task_fills_url(self):
+        with mock.patch.object(create_checkout_session, "delay") as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                r = self.checkout(**{"async": "true"})
+        self.assertEqual(r.status_code, status.HTTP_202_ACCEPTED, r.data)
+        self.assertIsNone(r.data["checkout_url"])
+        self.assertEqual(self.gw.sessions_created, 0)
+        delay.assert_called_once()
+
+        self.assertEqual(r["Retry-After"], "1")
+
+        status_url = reverse("payment-status", args=[r.data["id"]])
+        pending = self.client.get(status_url)
+        self.assertIsNone(pending.data["checkout_url"])
+        self.assertEqual(pending["Retry-After"], "1")
+
+        create_checkout_session(*delay.call_args.args)
+        ready = self.client.get(status_url)
+        self.assertEqual(ready.data["stripe_session_id"], "cs_1")
+        self.assertTrue(ready.data["checkout_url"])
+        self.assertFalse(ready.has_header("Retry-After"))
+
+    def test_sync_checkout_still_returns_url(self):
+        r = self.checkout(**{"async": "false"})
+        self.assertEqual(r.status_code, status.HTTP_201_CREATED, r.data)
+        self.assertTrue(r.data["checkout_url"])
+
+    def test_task_marks_payment_failed_on_stripe_error(self):
+        payment = Payment.objects.create(
+            user=self.user, course=self.course, amount=Decimal("500.00"),
+            method=Payment.Method.STRIPE, status=Payment.Status.PENDING,
+        )
+        with mock.patch.object(self.gw, "start_checkout", side_effect=stripe.StripeError("boom")):
+            create_checkout_session(payment.id, "http://s", "http://c")
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, Payment.Status.FAILED)
+
+    def test_status_is_private(self):
+        other = User.objects.create(email="stranger@test.com")
+        payment = Payment.objects.create(
+            user=other, course=self.course, amount=Decimal("1.00"),
+            method=Payment.Method.STRIPE, status=Payment.Status.PENDING,
+        )
+        r = self.client.get(reverse("payment-status", args=[payment.id]))
+        self.assertEqual(r.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class DeactivateInactiveUsersTests(TestCase):
+    def setUp(self):
+        cache.delete(DEACTIVATE_CHECKPOINT_KEY)
+        old = now() - timedelta(days=60)
+        self.stale = [User.objects.create(email=f"stale{i}@test.com", last_login=old) for i in range(5)]
+        self.never = User.objects.create(email="never@test.com")
+        self.recent = User.objects.create(email="recent@test.com", last_login=now())
+
+    def test_deactivates_in_batches(self):
+        result = deactivate_inactive_users(batch_size=2, pause=0)
+        self.assertEqual(result["rows"], 6)
+        self.assertEqual(result["batches"], 3)
+        self.assertFalse(User.objects.filter(pk__in=[u.pk for u in self.stale], is_active=True).exists())
+        self.never.refresh_from_db()
+        self.recent.refresh_from_db()
+        self.assertFalse(self.never.is_active)
+        self.assertTrue(self.recent.is_active)
+        self.assertIsNone(cache.get(DEACTIVATE_CHECKPOINT_KEY))
+
+    def test_resumes_from_checkpoint(self):
+        cache.set(DEACTIVATE_CHECKPOINT_KEY, self.stale[2].pk)
+        result = deactivate_inactive_users(batch_size=10, pause=0)
+        self.assertEqual(result["resumed_from_pk"], self.stale[2].pk)
+        self.assertEqual(result["rows"], 3)
+        self.assertTrue(User.objects.get(pk=self.stale[0].pk).is_active)
+
+
+class ClaimsJWTAuthenticationTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email="jwt@test.com", password="s3cret-pass")
+        self.course = Course.objects.create(name="JWT", description="d", owner=self.user)
+
+    def login(self):
+        r = self.client.post(reverse("token_obtain_pair"),
+                             {"email": "jwt@test.com", "password": "s3cret-pass"}, format="json")
+        self.assertEqual(r.status_code, status.HTTP_200_OK, r.data)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {r.data['access']}")
+
+    def test_read_requests_skip_user_lookup(self):
+        self.login()
+        self.client.get(reverse("course-list"))
+        with CaptureQueriesContext(connection) as ctx:
+            r = self.client.get(reverse("course-list"))
+        self.assertEqual(r.status_code, status.HTTP_200_OK, r.data)
+        self.assertEqual(len(r.data["results"]), 1)
+        tables = " ".join(q["sql"] for q in ctx.captured_queries)
+        self.assertNotIn('"users_customuser"', tables)
+        self.assertNotIn('"auth_group"', tables)
+
+    def test_writes_use_database_user(self):
+        self.login()
+        r = self.client.patch(reverse("user-detail", args=[self.user.id]), {"city": "Madrid"}, format="json")
+        self.assertEqual(r.status_code, status.HTTP_200_OK, r.data)
+
+    def test_group_change_revokes_token(self):
+        self.login()
+        self.assertEqual(self.client.get(reverse("course-list")).status_code, status.HTTP_200_OK)
+        self.user.groups.add(Group.objects.get_or_create(name="moderators")[0])
+        self.assertEqual(self.client.get(reverse("course-list")).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user_is_rejected(self):
+        self.login()
+        self.client.get(reverse("course-list"))
+        User.objects.filter(pk=self.user.pk).update(last_login=None)
+        deactivate_inactive_users(pause=0)
+        self.assertEqual(self.client.get(reverse("course-list")).status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+@mock.patch("config.db_router.replica_configured", return_value=True)
+class TokenStateRoutingTests(SimpleTestCase):
+    def test_token_state_fill_reads_primary(self, _):
+        cache.clear()
+        seen = []
+
+        def first():
+            seen.append(router.db_for_read(User))
+            return {"token_version": 0, "is_active": True, "is_staff": False}
+
+        with mock.patch.object(User.objects, "filter") as filter_, replica_reads():
+            filter_.return_value.values.return_value.first.side_effect = first
+            self.assertTrue(get_token_state(1)["is_active"])
+        self.assertEqual(seen, ["default"])
+
+
+class PaymentRollupTests(APITestCase):
+    def setUp(self):
+        self.admin = User.objects.create(email="finance@test.com", is_staff=True)
+        self.course = Course.objects.create(name="Rollup", description="d")
+        self.day1 = now() - timedelta(days=3)
+        self.day2 = now() - timedelta(days=1)
+        self.p1 = self.pay("100.00", Payment.Method.CASH, self.day1)
+        self.pay("300.00", Payment.Method.CASH, self.day1)
+        self.pay("50.00", Payment.Method.STRIPE, self.day2)
+
+    def pay(self, amount, method, paid_at):
+        payment = Payment.objects.create(user=self.admin, course=self.course, amount=Decimal(amount),
+                                         method=method, status=Payment.Status.PAID)
+        Payment.objects.filter(pk=payment.pk).update(paid_at=paid_at)
+        return payment
+
+    def test_refresh_builds_daily_buckets(self):
+        self.assertEqual(refresh_payment_rollup(), {"days": 2, "rows": 2})
+        bucket = PaymentDailyRollup.objects.get(method=Payment.Method.CASH)
+        self.assertEqual(bucket.revenue, Decimal("400.00"))
+        self.assertEqual(bucket.count, 2)
+
+    def test_refresh_is_incremental(self):
+        refresh_payment_rollup()
+        Payment.objects.update(updated_at=now() - timedelta(hours=2))
+        PaymentDailyRollup.objects.update(refreshed_at=now() - timedelta(hours=1))
+        self.assertEqual(refresh_payment_rollup(), {"days": 0, "rows": 0})
+
+        self.p1.status = Payment.Status.FAILED
+        self.p1.save()
+        self.assertEqual(refresh_payment_rollup()["days"], 1)
+        self.assertEqual(PaymentDailyRollup.objects.get(status=Payment.Status.FAILED).revenue, Decimal("100.00"))
+
+    def test_deleted_payment_marks_its_day(self):
+        refresh_payment_rollup()
+        Payment.objects.update(updated_at=now() - timedelta(hours=2))
+        PaymentDailyRollup.objects.update(refreshed_at=now() - timedelta(hours=1))
+        Payment.objects.get(pk=self.p1.pk).delete()
+        self.assertEqual(refresh_payment_rollup(), {"days": 1, "rows": 1})
+        self.assertEqual(PaymentDailyRollup.objects.get(method=Payment.Method.CASH).revenue, Decimal("300.00"))
+        self.assertFalse(PaymentDailyRollup.objects.filter(stale=True).exists())
+
+        self.admin.delete()
+        self.assertEqual(refresh_payment_rollup(), {"days": 2, "rows": 0})
+        self.assertFalse(PaymentDailyRollup.objects.exists())
+
+    def test_refresh_touches_only_changed_days_by_paid_at_range(self):
+        refresh_payment_rollup()
+        Payment.objects.update(updated_at=now() - timedelta(hours=2))
+        PaymentDailyRollup.objects.update(refreshed_at=now() - timedelta(hours=1))
+        midnight = localtime(self.day2).replace(hour=0, minute=0, second=0, microsecond=0)
+        self.pay("7.00", Payment.Method.CASH, midnight)
+        self.pay("9.00", Payment.Method.CASH, midnight - timedelta(microseconds=1))
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(refresh_payment_rollup()["days"], 2)
+        buckets = next(q["sql"] for q in ctx.captured_queries if 'SUM("users_payment"."amount")' in q["sql"])
+        self.assertIn('"users_payment"."paid_at" >=', buckets.split("WHERE")[1])
+        day2 = PaymentDailyRollup.objects.get(day=midnight.date(), method=Payment.Method.CASH)
+        self.assertEqual(day2.revenue, Decimal("7.00"))
+
+    def test_analytics_endpoint(self):
+        refresh_payment_rollup()
+        self.client.force_authenticate(user=self.admin)
+        r = self.client.get(reverse("payment-analytics"), {"period": "month", "group_by": "method"})
+        self.assertEqual(r.status_code, status.HTTP_200_OK, r.data)
+        by_method = {row["method"]: row for row in r.data}
+        self.assertEqual(by_method["cash"]["revenue"], "400.00")
+        self.assertEqual(by_method["cash"]["average"], "200.00")
+        self.assertEqual(by_method["stripe"]["count"], 1)
+
+    def test_analytics_is_admin_only(self):
+        self.client.force_authenticate(user=User.objects.create(email="nosy@test.com"))
+        self.assertEqual(self.client.get(reverse("payment-analytics")).status_code, status.HTTP_403_FORBIDDEN)
+
+
+class PaymentExportTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create(email="export@test.com", is_staff=True)
+        self.course = Course.objects.create(name="Export", description="d")
+        for method in (Payment.Method.CASH, Payment.Method.CASH, Payment.Method.TRANSFER):
+            Payment.objects.create(user=self.user, course=self.course, amount=Decimal("10.00"), method=method)
+        self.client.force_authenticate(user=self.user)
+
+    def export(self, fmt, **params):
+        r = self.client.get(reverse("payment-export", args=[fmt]), params)
+        self.assertEqual(r.status_code, status.HTTP_200_OK)
+        self.assertTrue(r.streaming)
+        return b"".join(r.streaming_content).decode()
+
+    def test_csv_export_applies_payment_filter(self):
+        lines = self.export("csv", method="cash").strip().splitlines()
+        self.assertEqual(lines[0].split(","), list(PaymentExportView.export_fields))
+        self.assertEqual(len(lines), 3)
+
+    def test_ndjson_export(self):
+        rows = [json.loads(line) for line in self.export("ndjson").splitlines()]
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0]["amount"], "10.00")
+
+    def test_export_is_staff_only(self):
+        self.client.force_authenticate(user=User.objects.create(email="customer@test.com"))
+        r = self.client.get(reverse("payment-export", args=["csv"]))
+        self.assertEqual(r.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_list_applies_payment_filter(self):
+        r = self.client.get(reverse("payment-list"), {"method": "transfer"})
+        self.assertEqual(r.data["count"], 1)
+
+
+class SeedLoadTests(TestCase):
+    def seed(self, prefix):
+        call_command(
+            "seed_load", users=30, courses=5, subscriptions=60, payments=200, batch_size=16, prefix=prefix,
+            stdout=io.StringIO(),
+        )
+        payments = Payment.objects.filter(user__email__startswith=f"{prefix}-")
+        return payments.aggregate(n=Count("id"), total=Sum("amount")), list(
+            payments.order_by("paid_at").values_list("method", "status")
+        )
+
+    def test_same_seed_gives_same_data(self):
+        first, second = self.seed("a"), self.seed("b")
+        self.assertEqual(first[0]["n"], 200)
+        self.assertEqual(first, second)
+
+    def test_existing_prefix_rejected(self):
+        self.seed("a")
+        with self.assertRaises(CommandError):
+            call_command("seed_load", users=1, courses=1, prefix="a", stdout=io.StringIO())
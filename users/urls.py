@@ -1,16 +1,22 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
-from .views import PaymentListView, RegisterAPIView, UserViewSet, PaymentCheckoutView
+from rest_framework_simplejwt.views import TokenRefreshView
+from .views import (
+    PaymentListView, RegisterAPIView, UserViewSet, PaymentCheckoutView, PaymentStatusView, MyTokenObtainPairView,
+    PaymentAnalyticsView, PaymentExportView,
+)
 
 router = DefaultRouter()
 router.register(r'users', UserViewSet, basename='user')
 
 urlpatterns = [
     path('payments/', PaymentListView.as_view(), name='payment-list'),
+    path('payments/analytics/', PaymentAnalyticsView.as_view(), name='payment-analytics'),
+    path('payments/export/<str:fmt>/', PaymentExportView.as_view(), name='payment-export'),
     path('register/', RegisterAPIView.as_view(), name='register'),
-    path('token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
+    path('token/', MyTokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('', include(router.urls)),
     path('payments/checkout/', PaymentCheckoutView.as_view(), name='payment-checkout'),
+    path('payments/<int:pk>/status/', PaymentStatusView.as_view(), name='payment-status'),
 ]
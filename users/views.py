@@ -1,18 +1,32 @@
+import csv
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django_filters.rest_framework import DjangoFilterBackend
 from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.urls import reverse
 from rest_framework import generics, viewsets, permissions, filters, status
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.exceptions import NotFound, PermissionDenied
 from .models import Payment
 from .serializers import (
     PaymentSerializer, MyTokenObtainPairSerializer,
     RegisterSerializer, UserSerializer,
-    PaymentCheckoutSerializer
+    PaymentCheckoutSerializer, PaymentStatusSerializer,
+    PaymentAnalyticsQuerySerializer, PaymentAnalyticsRowSerializer,
 )
+from .analytics import payment_analytics
 from .filters import PaymentFilter
+from lms.pagination import MyPagination
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.views import APIView
 
-from .stripe_checkout import kickoff_checkout
+from .stripe_checkout import checkout_return_urls, kickoff_checkout
+from .tasks import create_checkout_session
 
 
 User = get_user_model()
@@ -49,9 +63,92 @@ class PaymentListView(generics.ListAPIView):
     queryset = Payment.objects.select_related('user', 'course', 'lesson').all()
     serializer_class = PaymentSerializer
     filterset_class = PaymentFilter
-    filter_backends = [filters.OrderingFilter, ]
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     ordering_fields = ['paid_at', 'amount']
     ordering = ['-paid_at']
+    pagination_class = MyPagination
+    cursor_ordering = ('-paid_at', '-id')
+
+
+class PaymentExportView(generics.GenericAPIView):
+    """
+    Потоковая выгрузка платежей в CSV или NDJSON с теми же фильтрами и сортировкой,
+    что и у PaymentListView. Строки читаются серверным курсором через values_list,
+    без создания моделей, поэтому память не зависит от объёма выгрузки.
+    Выгрузка всех платежей — для финансов, как и аналитика: только персонал.
+    """
+    permission_classes = [permissions.IsAdminUser]
+    queryset = Payment.objects.all()
+    filterset_class = PaymentFilter
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    ordering_fields = ['paid_at', 'amount']
+    ordering = ['-paid_at', '-id']
+    export_fields = ('id', 'user_id', 'paid_at', 'course_id', 'lesson_id', 'amount', 'method', 'status')
+    chunk_size = 2000
+
+    def get(self, request, fmt, *args, **kwargs):
+        if fmt not in ('csv', 'ndjson'):
+            raise NotFound('Поддерживаются форматы csv и ndjson.')
+        queryset = self.filter_queryset(self.get_queryset())
+        # строки читаются уже после выхода из middleware, поэтому базу (реплику) выбираем сейчас
+        rows = (
+            queryset.using(queryset.db)
+            .values_list(*self.export_fields)
+            .iterator(chunk_size=self.chunk_size)
+        )
+        if fmt == 'csv':
+            content, content_type = self.csv_lines(rows), 'text/csv; charset=utf-8'
+        else:
+            content, content_type = self.ndjson_lines(rows), 'application/x-ndjson'
+        response = StreamingHttpResponse(content, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="payments.{fmt}"'
+        return response
+
+    def csv_lines(self, rows):
+        writer = csv.writer(Echo())
+        yield writer.writerow(self.export_fields)
+        for row in rows:
+            yield writer.writerow(row)
+
+    def ndjson_lines(self, rows):
+        for row in rows:
+            yield json.dumps(dict(zip(self.export_fields, row)), cls=DjangoJSONEncoder) + '\n'
+
+
+class Echo:
+    """Псевдо-файл для csv.writer: writerow возвращает строку вместо записи в буфер."""
+
+    def write(self, value):
+        return value
+
+
+class PaymentAnalyticsView(APIView):
+    """
+    Выручка, количество и средний чек по дням/неделям/месяцам с группировкой по курсу,
+    способу и статусу: ?period=week&group_by=course&group_by=method&status=paid.
+    Читается только из PaymentDailyRollup.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        params = PaymentAnalyticsQuerySerializer(data={
+            **request.query_params.dict(),
+            'group_by': request.query_params.getlist('group_by'),
+            'status': request.query_params.getlist('status'),
+            'method': request.query_params.getlist('method'),
+        })
+        params.is_valid(raise_exception=True)
+        data = params.validated_data
+        rows = payment_analytics(
+            period=data['period'],
+            group_by=sorted(data.get('group_by', ())),
+            date_from=data.get('date_from'),
+            date_to=data.get('date_to'),
+            statuses=data.get('status'),
+            methods=data.get('method'),
+            course_id=data.get('course'),
+        )
+        return Response(PaymentAnalyticsRowSerializer(rows, many=True).data)
 
 
 class MyTokenObtainPairView(TokenObtainPairView):
@@ -74,11 +171,51 @@ class PaymentCheckoutView(generics.CreateAPIView):
             status=Payment.Status.PENDING,
         )
 
-        session_id, url = kickoff_checkout(payment, request)
-        payment.stripe_session_id = session_id
-        payment.checkout_url = url
-        payment.save(update_fields=['stripe_session_id', 'checkout_url'])
+        if self.use_async(request):
+            success_url, cancel_url = checkout_return_urls(request)
+            transaction.on_commit(lambda: create_checkout_session.delay(payment.id, success_url, cancel_url))
+            output = PaymentSerializer(payment).data
+            output['status_url'] = request.build_absolute_uri(reverse('payment-status', args=[payment.id]))
+            headers = {'Retry-After': str(settings.PAYMENT_STATUS_RETRY_AFTER)}
+            return Response(output, status=status.HTTP_202_ACCEPTED, headers=headers)
+
+        kickoff_checkout(payment, request)
 
         output = PaymentSerializer(payment).data
         headers = self.get_success_headers(serializer.data)
         return Response(output, status=status.HTTP_201_CREATED, headers=headers)
+
+    def use_async(self, request):
+        """?async=true|false переопределяет настройку STRIPE_CHECKOUT_ASYNC."""
+        value = request.query_params.get('async')
+        if value is None:
+            return settings.STRIPE_CHECKOUT_ASYNC
+        return value.lower() in ('1', 'true', 'yes')
+
+
+class PaymentStatusView(generics.RetrieveAPIView):
+    """
+    Лёгкий статус платежа для опроса после асинхронного checkout. Ответ отдаётся сразу,
+    без ожидания на сервере: пока ссылки на оплату нет, заголовок Retry-After
+    (PAYMENT_STATUS_RETRY_AFTER секунд) подсказывает клиенту, когда спросить снова.
+    """
+    serializer_class = PaymentStatusSerializer
+    permission_classes = [IsAuthenticated]
+    # статус меняет воркер сразу после checkout; отставание реплики здесь недопустимо
+    use_replica = False
+
+    def get_queryset(self):
+        return Payment.objects.filter(user_id=self.request.user.id).only(
+            'id', 'user_id', 'status', 'stripe_session_id', 'checkout_url'
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        payment = self.get_object()
+        response = Response(self.get_serializer(payment).data)
+        if not self.is_ready(payment):
+            response['Retry-After'] = str(settings.PAYMENT_STATUS_RETRY_AFTER)
+        return response
+
+    @staticmethod
+    def is_ready(payment):
+        return bool(payment.checkout_url) or payment.status != Payment.Status.PENDING